@@ -0,0 +1,143 @@
+"""Аутентификация по токену из таблицы или по подписанному токену.
+
+В режиме AUTH_TOKEN_MODE = 'signed' вход выдаёт подписанный токен
+с id пользователя и полями, нужными API. Такой токен проверяется
+без запросов к БД; отзыв при выходе и смене пароля хранится в таблице
+RevokedToken и в памяти процесса. Заголовок остаётся прежним:
+Authorization: Token <токен>.
+"""
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from user.models import RevokedToken
+from .constants import REVOCATION_LIST_TTL
+from .versioned_cache import VersionedCache
+
+User = get_user_model()
+SIGNED = 'signed'
+# Поля пользователя в токене; остальные загружаются при обращении.
+CLAIM_FIELDS = ('username', 'email', 'role', 'is_staff', 'is_superuser')
+REVOCATION_LIST_VERSION_KEY = 'revocation_list_version'
+
+
+def issue_token(user):
+    """Подписанный токен пользователя."""
+    token = AccessToken.for_user(user)
+    token['iat'] = token.current_time.timestamp()
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    return str(token)
+
+
+def token_user(payload):
+    """Пользователь из полей токена без запроса к БД.
+
+    Поля, которых нет в токене, отложены, как у only().
+    """
+    values = {field: payload[field] for field in CLAIM_FIELDS}
+    values['id'] = payload[jwt_settings.USER_ID_CLAIM]
+    values['is_active'] = True
+    field_names = [field.attname for field in User._meta.concrete_fields
+                   if field.attname in values]
+    return User.from_db(router.db_for_read(User), field_names,
+                        [values[name] for name in field_names])
+
+
+def load_user(user):
+    """Загружает отложенные поля пользователя одним запросом."""
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
+
+
+class RevocationList(VersionedCache):
+    """Отозванные токены в памяти процесса.
+
+    Перестраивается из БД при смене версии в кэше Django или
+    по истечении REVOCATION_LIST_TTL секунд. Отзыв действует сразу
+    в своём процессе, а после коммита увеличивает версию, и воркеры
+    с общим кэшем (CACHE_LOCATION) перечитывают список на следующем
+    запросе. Без общего кэша версия своя у каждого воркера, и отзыв
+    доходит до них не позже чем через REVOCATION_LIST_TTL секунд.
+    """
+
+    version_key = REVOCATION_LIST_VERSION_KEY
+    ttl = REVOCATION_LIST_TTL
+
+    def __init__(self):
+        """Пустой список, строится при первом обращении."""
+        super().__init__()
+        self._tokens = frozenset()
+        self._users = {}
+
+    def load(self):
+        """Загружает действующие отзывы из БД."""
+        tokens, users = set(), {}
+        for user_id, jti, revoked_at in RevokedToken.objects.filter(
+                expires_at__gt=timezone.now()
+        ).values_list('user_id', 'jti', 'revoked_at'):
+            if jti:
+                tokens.add(jti)
+            else:
+                users[user_id] = max(users.get(user_id, 0),
+                                     revoked_at.timestamp())
+        self._tokens, self._users = frozenset(tokens), users
+
+    def is_revoked(self, payload):
+        """Токен отозван сам или вместе со всеми токенами пользователя."""
+        self.ensure_fresh()
+        not_before = self._users.get(payload[jwt_settings.USER_ID_CLAIM])
+        return (payload[jwt_settings.JTI_CLAIM] in self._tokens
+                or (not_before is not None
+                    and payload.get('iat', 0) < not_before))
+
+    def revoke(self, user_id, jti='', expires_at=None):
+        """Отзывает токен или, без jti, все выданные токены пользователя."""
+        now = timezone.now()
+        RevokedToken.objects.filter(expires_at__lte=now).delete()
+        RevokedToken.objects.create(
+            user_id=user_id, jti=jti,
+            expires_at=expires_at or now + jwt_settings.ACCESS_TOKEN_LIFETIME)
+        self._built_at = None
+        transaction.on_commit(self.invalidate)
+
+    def revoke_token(self, token):
+        """Отзывает подписанный токен до истечения его срока."""
+        self.revoke(token[jwt_settings.USER_ID_CLAIM],
+                    token[jwt_settings.JTI_CLAIM],
+                    datetime_from_epoch(token['exp']))
+
+
+revocation_list = RevocationList()
+
+
+class SignedTokenAuthentication(authentication.TokenAuthentication):
+    """Токен из таблицы authtoken_token или подписанный токен.
+
+    Подписанный токен отличается точками в ключе. Принимаются оба
+    вида, поэтому смена AUTH_TOKEN_MODE не разлогинивает пользователей
+    со старыми токенами.
+    """
+
+    def authenticate_credentials(self, key):
+        """Пользователь и токен по ключу."""
+        if '.' not in key:
+            return super().authenticate_credentials(key)
+        try:
+            token = AccessToken(key)
+        except TokenError:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        try:
+            if revocation_list.is_revoked(token.payload):
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            return token_user(token.payload), token
+        except KeyError:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
@@ -0,0 +1,67 @@
+"""Автодополнение ингредиентов по индексу в памяти процесса."""
+from bisect import bisect_left
+
+from recipe.models import Ingredient
+from .constants import INGREDIENT_INDEX_TTL, INGREDIENT_SEARCH_LIMIT
+from .versioned_cache import VersionedCache
+
+INDEX_VERSION_KEY = 'ingredient_index_version'
+
+
+class IngredientIndex(VersionedCache):
+    """Отсортированный индекс названий ингредиентов в нижнем регистре.
+
+    Поиск по префиксу идёт бинарным поиском, затем добавляются
+    совпадения по подстроке. Индекс перестраивается лениво при смене
+    версии в кэше Django (её увеличивают сигналы изменения
+    ингредиентов) либо по истечении INGREDIENT_INDEX_TTL секунд.
+    """
+
+    version_key = INDEX_VERSION_KEY
+    ttl = INGREDIENT_INDEX_TTL
+
+    def __init__(self):
+        """Пустой индекс, строится при первом поиске."""
+        super().__init__()
+        self._index = ([], [])
+
+    def load(self):
+        """Загружает ингредиенты из БД и строит индекс."""
+        rows = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit')
+        entries = sorted(
+            (name.casefold(), measurement_unit, pk, name)
+            for pk, name, measurement_unit in rows.iterator()
+        )
+        self._index = (
+            [entry[0] for entry in entries],
+            [{'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+             for _, measurement_unit, pk, name in entries],
+        )
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        """Ингредиенты, начинающиеся с query, затем содержащие его."""
+        self.ensure_fresh()
+        keys, items = self._index
+        query = query.strip().casefold()
+        if not query:
+            return items[:limit]
+
+        start = bisect_left(keys, query)
+        end = start
+        while (end < len(keys) and end - start < limit
+               and keys[end].startswith(query)):
+            end += 1
+        results = items[start:end]
+        if len(results) == limit:
+            return results
+
+        for key, item in zip(keys, items):
+            if query in key and not key.startswith(query):
+                results.append(item)
+                if len(results) == limit:
+                    break
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,73 @@
+"""Условные GET-запросы по счётчикам изменений (ETag, Last-Modified)."""
+import hashlib
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+from recipe.models import ChangeCounter
+
+RECIPES = 'recipes'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+FAVOURITES = 'favourites'
+USER = 'user:{}'
+
+
+def bump_counters(*names):
+    """Увеличивает счётчики изменений, создавая отсутствующие."""
+    updated = ChangeCounter.objects.filter(name__in=names).update(
+        value=F('value') + 1, updated_at=timezone.now())
+    if updated < len(names):
+        ChangeCounter.objects.bulk_create(
+            (ChangeCounter(name=name, value=1) for name in names),
+            ignore_conflicts=True)
+
+
+def get_counters(names):
+    """Значения счётчиков и дата последнего изменения одним запросом."""
+    counters = dict.fromkeys(names, 0)
+    last_modified = None
+    for name, value, updated_at in ChangeCounter.objects.filter(
+            name__in=names).values_list('name', 'value', 'updated_at'):
+        counters[name] = value
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+    return counters, last_modified
+
+
+def get_etag(counters):
+    """ETag по значениям счётчиков."""
+    state = ';'.join(f'{name}={value}'
+                     for name, value in sorted(counters.items()))
+    return quote_etag(hashlib.md5(state.encode()).hexdigest())
+
+
+def conditional_response(request, names, render, personal=False):
+    """Ответ 304 при совпадении валидаторов, иначе результат render().
+
+    Для персональных ответов в валидаторы входит счётчик пользователя.
+    Прочитанные счётчики сохраняются в request.change_counters для
+    ключа кэша ответов.
+    """
+    names = list(names)
+    if personal and request.user.is_authenticated:
+        names.append(USER.format(request.user.pk))
+    counters, last_modified = get_counters(names)
+    request.change_counters = counters
+    etag = get_etag(counters)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=timestamp)
+    if not_modified is not None:
+        return not_modified
+    response = render()
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        if personal:
+            patch_vary_headers(response, ('Authorization',))
+    return response
@@ -1 +1,41 @@
 PAGE_SIZE = 6
+BULK_RECIPES_LIMIT = 100
+POPULAR_ORDERING = 'popular'
+SHOPPING_LIST_CHUNK_SIZE = 2000
+TRANSFER_CHUNK_SIZE = 500
+TRANSFER_BATCH_SIZE = 500
+SHOPPING_LIST_FILENAME = 'shopping_list'
+RECIPES_EXPORT_FILENAME = 'recipes.ndjson'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+SHOPPING_LIST_DEFAULT_FORMAT = 'txt'
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_INDEX_TTL = 300
+TAG_MAP_TTL = 300
+REVOCATION_LIST_TTL = 10
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+SHORT_LINK_LOCAL_SIZE = 1024
+SHORT_LINK_LOCAL_TTL = 60 * 5
+# Варианты изображений: ширина, высота, обрезка под размер.
+RECIPE_IMAGE_VARIANTS = {
+    'card': (480, 360, False),
+    'detail': (1200, 900, False),
+}
+AVATAR_IMAGE_VARIANTS = {
+    'avatar': (160, 160, True),
+}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_WORKER_BATCH_SIZE = 10
+IMAGE_WORKER_INTERVAL = 2
+GC_MEDIA_BATCH_SIZE = 1000
+GC_MEDIA_MIN_AGE = 60 * 60 * 24
+# Лимиты дорогих действий: группа лимита и стоимость в токенах.
+RECIPE_THROTTLE_COSTS = {
+    'create': ('recipe_write', 5),
+    'partial_update': ('recipe_write', 3),
+    'download_shopping_cart': ('shopping_cart', 2),
+}
+USER_THROTTLE_COSTS = {
+    'avatar': ('avatar', 2),
+}
+THROTTLE_LOCAL_MAX_BUCKETS = 10000
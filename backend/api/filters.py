@@ -1,51 +1,99 @@
-from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
+from django_filters import fields
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
 
-from recipe.models import Recipe, Tag
+from recipe.models import Favourite, Recipe, ShoppingCart
+from .constants import POPULAR_ORDERING
+from .search import search_recipes
+from .tag_map import tag_map
 
 
-User = get_user_model()
+def tag_choices():
+    """Слаги тегов из словаря в памяти процесса."""
+    return tag_map.choices()
 
 
-class IngredientSearchFilter(SearchFilter):
-    """Поисковый фильтр ингредиентов по имени."""
+class TagSlugField(fields.MultipleChoiceField):
+    """Слаги тегов: неизвестные словарю процесса проверяются по БД."""
 
-    search_param = 'name'
+    def validate(self, value):
+        """Проверка слагов по словарю, обновлённому при необходимости."""
+        tag_map.ensure_known(value)
+        super().validate(value)
+
+
+class TagSlugFilter(filters.MultipleChoiceFilter):
+    """Фильтр по слагам тегов из словаря в памяти процесса."""
+
+    field_class = TagSlugField
 
 
 class RecipeFilter(FilterSet):
     """Фильтерсет рецептов.
 
-    По тегам, авторам, избранным, в списке покупок.
+    По тегам, авторам, избранным, в списке покупок и поиск по тексту.
+    Сортировка по популярности, если задана, важнее релевантности.
+    Все фильтры по связанным таблицам записаны через EXISTS, поэтому
+    строки не дублируются и DISTINCT не нужен.
     """
 
-    author = filters.ModelChoiceFilter(
-        queryset=User.objects.all())
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    author = filters.NumberFilter(field_name='author_id')
+    tags = TagSlugFilter(
+        choices=tag_choices,
+        method='filter_tags',
+        distinct=False,
     )
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart')
     is_favorited = filters.NumberFilter(
         method='filter_is_favorited')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=((POPULAR_ORDERING, 'По популярности'),),
+        method='filter_ordering')
 
     class Meta:
         """Класс Мета."""
 
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
 
-    def filter_is_favorited(self, queryset, name, value):
-        """Метод на фильтр избранный."""
+    def filter_tags(self, queryset, name, value):
+        """Метод на фильтр по любому из тегов.
+
+        Слаги проверяются по словарю тегов в памяти процесса.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=tag_map.ids(value))))
+
+    def filter_user_list(self, queryset, model, value):
+        """Рецепты из списка текущего пользователя."""
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favourite__author=self.request.user)
+            return queryset.filter(Exists(model.objects.filter(
+                author=self.request.user, recipe_id=OuterRef('pk'))))
         return queryset
 
+    def filter_is_favorited(self, queryset, name, value):
+        """Метод на фильтр избранный."""
+        return self.filter_user_list(queryset, Favourite, value)
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Метод на фильтр в списке покупок."""
-        if self.request.user.is_authenticated and value:
-            return queryset.filter(shopping_carts__author=self.request.user)
-        return queryset
+        return self.filter_user_list(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск в порядке релевантности."""
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по счётчику избранного.
+
+        С курсорной пагинацией, которая сортирует по дате, не
+        сочетается: такой запрос получает 400.
+        """
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
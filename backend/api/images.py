@@ -0,0 +1,218 @@
+"""Фоновая обработка изображений: уменьшенные варианты для клиентов.
+
+Оригинал по-прежнему сохраняется в запросе. После сохранения объекта
+сигнал ставит задачу ImageJob, воркер (manage.py process_images)
+создаёт варианты и записывает их имена и размеры в JSON-поле объекта.
+Пока вариантов нет, клиенты получают пустой словарь и оригинал.
+"""
+import io
+import logging
+from collections import namedtuple
+from functools import partial
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+from rest_framework import serializers
+
+from recipe.models import ImageJob, Recipe
+from .conditional import RECIPES, bump_counters
+from .constants import (AVATAR_IMAGE_VARIANTS,
+                        IMAGE_JOB_MAX_ATTEMPTS,
+                        IMAGE_VARIANT_QUALITY,
+                        RECIPE_IMAGE_VARIANTS)
+
+logger = logging.getLogger('api.images')
+User = get_user_model()
+ImageSpec = namedtuple(
+    'ImageSpec', ('field', 'variants_field', 'sizes', 'recipes_lookup'))
+IMAGE_SPECS = {
+    Recipe._meta.label_lower: ImageSpec(
+        'image', 'image_variants', RECIPE_IMAGE_VARIANTS, 'pk'),
+    User._meta.label_lower: ImageSpec(
+        'avatar', 'avatar_variants', AVATAR_IMAGE_VARIANTS, 'author_id'),
+}
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def output_format():
+    """Формат вариантов: WebP, если Pillow собран с его поддержкой."""
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def variant_sizes(sizes):
+    """Размеры вариантов в виде, в котором они хранятся в JSON."""
+    return {name: list(size) for name, size in sizes.items()}
+
+
+def needs_variants(instance, update_fields=None):
+    """Изображение объекта изменилось и варианты устарели."""
+    spec = IMAGE_SPECS.get(instance._meta.label_lower)
+    if spec is None or not {spec.field, spec.variants_field}.isdisjoint(
+            instance.get_deferred_fields()):
+        return False
+    if update_fields is not None and spec.field not in update_fields:
+        return False
+    source = getattr(instance, spec.field).name or None
+    variants = getattr(instance, spec.variants_field)
+    if source is None:
+        return bool(variants)
+    return (variants.get('source') != source
+            or variants.get('sizes') != variant_sizes(spec.sizes))
+
+
+def enqueue_images(model, object_ids):
+    """Ставит задачи обработки, сбрасывая попытки существующих."""
+    object_ids = list(object_ids)
+    updated = ImageJob.objects.filter(
+        model=model, object_id__in=object_ids
+    ).update(attempts=0, error='')
+    if updated < len(object_ids):
+        ImageJob.objects.bulk_create(
+            (ImageJob(model=model, object_id=pk) for pk in object_ids),
+            ignore_conflicts=True)
+
+
+def prepare(image, image_format):
+    """Поворот по EXIF и приведение к режиму формата вариантов."""
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    if not has_alpha:
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    if image_format == 'WEBP':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_variant(image, width, height, crop, image_format):
+    """Уменьшенная и пережатая копия изображения."""
+    if crop:
+        variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        variant = image.copy()
+        variant.thumbnail((width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, image_format, quality=IMAGE_VARIANT_QUALITY,
+                 optimize=True, progressive=True)
+    return buffer.getvalue(), variant.size
+
+
+def build_variants(field_file, sizes):
+    """Создаёт файлы вариантов и возвращает их описание."""
+    image_format, extension = output_format()
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        # JPEG декодируется сразу в уменьшенном масштабе.
+        image.draft('RGB', (max(size[0] for size in sizes.values()),
+                            max(size[1] for size in sizes.values())))
+        image = prepare(image, image_format)
+
+    path = PurePosixPath(field_file.name)
+    variants = {}
+    for name, (variant_width, variant_height, crop) in sizes.items():
+        data, size = render_variant(
+            image, variant_width, variant_height, crop, image_format)
+        file_name = str(path.parent / 'variants'
+                        / f'{path.stem}_{name}.{extension}')
+        variants[name] = {
+            'name': storage.save(file_name, ContentFile(data)),
+            'width': size[0],
+            'height': size[1],
+        }
+    return {'source': field_file.name, 'width': width, 'height': height,
+            'sizes': variant_sizes(sizes), 'variants': variants}
+
+
+def process_job(job):
+    """Создаёт варианты изображения объекта задачи.
+
+    Возвращает False, если изображение сменилось во время обработки:
+    тогда задача остаётся в очереди. Файлы вариантов могут быть общими
+    у одинаковых изображений, устаревшие удаляет gc_media.
+    """
+    spec = IMAGE_SPECS[job.model]
+    model = apps.get_model(job.model)
+    instance = model.objects.filter(pk=job.object_id).only(
+        'pk', spec.field, spec.variants_field).first()
+    if instance is None or not needs_variants(instance):
+        return True
+    field_file = getattr(instance, spec.field)
+    variants = build_variants(field_file, spec.sizes) if field_file else {}
+    updated = model.objects.filter(
+        pk=instance.pk, **{spec.field: field_file.name}
+    ).update(**{spec.variants_field: variants})
+    if not updated:
+        return False
+
+    if Recipe.objects.filter(**{spec.recipes_lookup: instance.pk}).exists():
+        transaction.on_commit(partial(bump_counters, RECIPES))
+    return True
+
+
+def process_pending(batch_size):
+    """Обрабатывает пачку задач очереди и возвращает их число.
+
+    Задачи блокируются с SKIP LOCKED, поэтому воркеров может быть
+    несколько. Ошибочная задача повторяется до IMAGE_JOB_MAX_ATTEMPTS раз.
+    """
+    with transaction.atomic():
+        jobs = list(ImageJob.objects.select_for_update(skip_locked=True)
+                    .filter(attempts__lt=IMAGE_JOB_MAX_ATTEMPTS)
+                    .order_by('id')[:batch_size])
+        for job in jobs:
+            try:
+                with transaction.atomic():
+                    done = process_job(job)
+            except Exception as error:
+                logger.exception('Ошибка обработки изображения %s', job)
+                job.attempts += 1
+                job.error = repr(error)
+                job.save(update_fields=('attempts', 'error'))
+                continue
+            if done:
+                job.delete()
+    return len(jobs)
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки и размеры готовых вариантов изображения объекта.
+
+    Варианты устаревшего изображения не отдаются.
+    """
+
+    def __init__(self, **kwargs):
+        """Поле только для чтения, по умолчанию от всего объекта."""
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', '*')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        """Словарь имя варианта -> ссылка, ширина и высота."""
+        spec = IMAGE_SPECS[value._meta.label_lower]
+        variants = getattr(value, spec.variants_field)
+        field_file = getattr(value, spec.field)
+        if not field_file or variants.get('source') != field_file.name:
+            return {}
+        request = self.context.get('request')
+        result = {}
+        for name, variant in variants['variants'].items():
+            url = field_file.storage.url(variant['name'])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            result[name] = {'url': url, 'width': variant['width'],
+                            'height': variant['height']}
+        return result
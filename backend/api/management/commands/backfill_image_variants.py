@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from api.images import IMAGE_SPECS, enqueue_images, needs_variants
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Постановка в очередь изображений без актуальных вариантов.
+
+    Подхватывает и объекты, созданные до появления вариантов, и объекты
+    с вариантами старых размеров после изменения настроек.
+    """
+
+    help = 'Ставит в очередь обработку изображений без вариантов'
+
+    def handle(self, *args, **options):
+        """Запуск команды."""
+        for label, spec in IMAGE_SPECS.items():
+            instances = apps.get_model(label).objects.only(
+                'pk', spec.field, spec.variants_field
+            ).order_by('pk').iterator(chunk_size=BATCH_SIZE)
+            ids, total = [], 0
+            for instance in instances:
+                if needs_variants(instance):
+                    ids.append(instance.pk)
+                if len(ids) == BATCH_SIZE:
+                    enqueue_images(label, ids)
+                    total, ids = total + len(ids), []
+            if ids:
+                enqueue_images(label, ids)
+                total += len(ids)
+            self.stdout.write(f'{label}: в очереди {total}')
@@ -0,0 +1,295 @@
+import base64
+import io
+import json
+import math
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipe.models import (Favourite,
+                           Follow,
+                           Ingredient,
+                           Recipe,
+                           RecipeIngredient,
+                           ShoppingCart,
+                           Tag)
+
+User = get_user_model()
+PERCENTILES = (50, 90, 95, 99)
+BENCH_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'CACHES': {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench',
+    }},
+    'SLOW_REQUEST_THRESHOLD_MS': 10 ** 9,
+    'THROTTLE_ENABLED': False,
+}
+
+
+def make_image():
+    """Небольшая картинка в base64 для поля image."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    """Воспроизводимый бенчмарк горячих путей API.
+
+    Создаёт синтетические данные в транзакции, замеряет запросы через
+    тестовый клиент от имени одного пользователя и откатывает всё.
+    Отчёт в JSON можно сравнить с сохранённым базовым отчётом.
+    """
+
+    help = 'Бенчмарк основных эндпоинтов API на синтетических данных'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=200,
+                            help='Размер каталога ингредиентов.')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=int, default=10)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument(
+            '--create-counts', default='1,10,30,100',
+            help='Число ингредиентов в создаваемых рецептах через запятую, '
+                 'по сценарию recipe_create_N на каждое значение.')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--output', help='Файл для JSON-отчёта.')
+        parser.add_argument('--baseline',
+                            help='Базовый JSON-отчёт для сравнения.')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='Допустимый рост p50 в процентах; при превышении или '
+                 'росте числа запросов команда завершается с ошибкой.')
+
+    def handle(self, *args, **options):
+        """Запуск бенчмарка."""
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным.')
+        try:
+            self.create_counts = [
+                int(count) for count in options['create_counts'].split(',')]
+        except ValueError:
+            raise CommandError('--create-counts: числа через запятую.')
+        if not all(0 < count <= options['ingredients']
+                   for count in self.create_counts):
+            raise CommandError(
+                '--create-counts: от 1 до --ingredients ингредиентов.')
+        self.random = random.Random(options['seed'])
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root, **BENCH_SETTINGS):
+            with transaction.atomic():
+                self.seed(options)
+                results = self.run(options['repeat'])
+                transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'params': {name: options[name] for name in (
+                    'seed', 'users', 'recipes', 'ingredients',
+                    'ingredients_per_recipe', 'favorites_per_user',
+                    'carts_per_user', 'follows_per_user', 'create_counts',
+                    'repeat')},
+            },
+            'results': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2),
+                encoding='utf-8')
+        self.print_report(results)
+        if options['baseline']:
+            baseline = json.loads(
+                Path(options['baseline']).read_text(encoding='utf-8'))
+            self.compare(results, baseline['results'],
+                         options['max_regression'])
+
+    def seed(self, options):
+        """Создаёт синтетические данные."""
+        rnd = self.random
+        User.objects.bulk_create(
+            User(username=f'bench{number}',
+                 email=f'bench{number}@bench.local',
+                 first_name='Bench', last_name=str(number),
+                 password='!')
+            for number in range(options['users'])
+        )
+        users = list(User.objects.filter(
+            email__endswith='@bench.local').order_by('id'))
+        self.user = users[0]
+        Tag.objects.bulk_create(
+            Tag(name=f'bench {number}', slug=f'bench-{number}')
+            for number in range(5)
+        )
+        self.tags = list(Tag.objects.filter(
+            slug__startswith='bench-').order_by('id'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ingredient {number}',
+                       measurement_unit='г')
+            for number in range(options['ingredients'])
+        )
+        self.ingredients = list(Ingredient.objects.filter(
+            name__startswith='bench ingredient ').order_by('id'))
+
+        Recipe.objects.bulk_create(
+            Recipe(name=f'bench recipe {number}',
+                   author=rnd.choice(users),
+                   image='recipes/images/bench.png',
+                   text='bench', cooking_time=rnd.randint(1, 120))
+            for number in range(options['recipes'])
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith='bench recipe ').order_by('id'))
+        per_recipe = min(options['ingredients_per_recipe'],
+                         len(self.ingredients))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredients=ingredient,
+                             amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rnd.sample(self.ingredients, per_recipe)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rnd.sample(self.tags, rnd.randint(1, 2))
+        )
+
+        for model, per_user in ((Favourite, options['favorites_per_user']),
+                                (ShoppingCart, options['carts_per_user'])):
+            model.objects.bulk_create(
+                model(author=user, recipe=recipe)
+                for user in users
+                for recipe in rnd.sample(recipes,
+                                         min(per_user, len(recipes)))
+            )
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for user in users
+            for author in rnd.sample(
+                [other for other in users if other != user],
+                min(options['follows_per_user'], len(users) - 1))
+        )
+        self.recipe = recipes[0]
+
+    def scenarios(self):
+        """Замеряемые запросы: имя и функция, выполняющая запрос."""
+        client = self.client
+        tags = '&'.join(f'tags={tag.slug}' for tag in self.tags[:2])
+        counter = iter(range(10 ** 9))
+        image = make_image()
+        ingredient_ids = [ingredient.id for ingredient in self.ingredients]
+
+        def get(url):
+            return lambda: client.get(url)
+
+        def download():
+            response = client.get('/api/recipes/download_shopping_cart/')
+            b''.join(response.streaming_content)
+            return response
+
+        def create(count):
+            return lambda: client.post('/api/recipes/', {
+                'name': f'bench new {next(counter)}',
+                'text': 'bench',
+                'cooking_time': 10,
+                'image': image,
+                'tags': [self.tags[0].id],
+                'ingredients': [{'id': pk, 'amount': 10}
+                                for pk in ingredient_ids[:count]],
+            }, format='json')
+
+        return (
+            ('recipe_list', get('/api/recipes/')),
+            ('recipe_list_cursor', get('/api/recipes/?pagination=cursor')),
+            ('recipe_detail', get(f'/api/recipes/{self.recipe.pk}/')),
+            ('recipe_filter_tags', get(f'/api/recipes/?{tags}')),
+            ('recipe_filter_favorited', get('/api/recipes/?is_favorited=1')),
+            ('download_shopping_cart', download),
+            ('subscriptions',
+             get('/api/users/subscriptions/?recipes_limit=3')),
+            *((f'recipe_create_{count}', create(count))
+              for count in self.create_counts),
+            ('ingredient_search', get('/api/ingredients/?name=bench ingr')),
+        )
+
+    def run(self, repeat):
+        """Выполняет сценарии и собирает статистику."""
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        results = {}
+        for name, request in self.scenarios():
+            request()
+            timings, queries = [], []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = request()
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name}: ответ {response.status_code}')
+            result = {f'p{percent}_ms': round(percentile(timings, percent), 3)
+                      for percent in PERCENTILES}
+            result['mean_ms'] = round(statistics.mean(timings), 3)
+            result['queries'] = max(queries)
+            results[name] = result
+        return results
+
+    def print_report(self, results):
+        """Выводит таблицу результатов."""
+        self.stdout.write(f'{"scenario":<26}{"p50":>9}{"p95":>9}'
+                          f'{"p99":>9}{"queries":>9}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<26}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["p99_ms"]:>9.2f}{result["queries"]:>9}')
+
+    def compare(self, results, baseline, max_regression):
+        """Сравнивает результаты с базовым отчётом."""
+        self.stdout.write('')
+        self.stdout.write(f'{"scenario":<26}{"p50":>9}{"base":>9}'
+                          f'{"delta":>9}{"queries":>12}')
+        failures = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            delta = ((result['p50_ms'] - base['p50_ms'])
+                     / base['p50_ms'] * 100 if base['p50_ms'] else 0)
+            queries = f'{base["queries"]}->{result["queries"]}'
+            self.stdout.write(
+                f'{name:<26}{result["p50_ms"]:>9.2f}{base["p50_ms"]:>9.2f}'
+                f'{delta:>+8.1f}%{queries:>12}')
+            if max_regression is not None and (
+                    delta > max_regression
+                    or result['queries'] > base['queries']):
+                failures.append(name)
+        if failures:
+            raise CommandError(f'Регрессия: {", ".join(failures)}')
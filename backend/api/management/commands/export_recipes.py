@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api.constants import TRANSFER_CHUNK_SIZE
+from api.transfer import export_recipes
+
+
+class Command(BaseCommand):
+    """Выгрузка всех рецептов в NDJSON."""
+
+    help = 'Выгружает рецепты с ингредиентами и тегами в NDJSON'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=TRANSFER_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        """Запуск выгрузки."""
+        lines = export_recipes(options['chunk_size'])
+        if options['path'] == '-':
+            sys.stdout.writelines(lines)
+            return
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            file.writelines(lines)
@@ -0,0 +1,154 @@
+import os
+import posixpath
+import time
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.constants import GC_MEDIA_BATCH_SIZE, GC_MEDIA_MIN_AGE
+from api.images import IMAGE_SPECS
+from api.transfer import chunked
+
+
+def walk(root, relative):
+    """Файлы каталога хранилища в порядке сравнения строк имён."""
+    try:
+        entries = list(os.scandir(os.path.join(root, relative)))
+    except FileNotFoundError:
+        return
+    # Каталог «a» сортируется как «a/», чтобы «a-b» шёл раньше «a/c».
+    keyed = sorted(
+        (entry.name + '/' if entry.is_dir(follow_symlinks=False)
+         else entry.name, entry)
+        for entry in entries)
+    for key, entry in keyed:
+        name = posixpath.join(relative, entry.name)
+        if key.endswith('/'):
+            yield from walk(root, name)
+        elif entry.is_file(follow_symlinks=False):
+            yield name
+
+
+def orphans(files, references):
+    """Файлы без ссылок: слияние двух отсортированных потоков."""
+    reference = next(references, None)
+    for name in files:
+        while reference is not None and reference < name:
+            reference = next(references, None)
+        if reference != name:
+            yield name
+
+
+def reference_sql():
+    """Запрос имён файлов из полей изображений и их вариантов."""
+    quote = connection.ops.quote_name
+    parts = []
+    for label, spec in IMAGE_SPECS.items():
+        model = apps.get_model(label)
+        table = quote(model._meta.db_table)
+        column = quote(model._meta.get_field(spec.field).column)
+        variants = quote(model._meta.get_field(spec.variants_field).column)
+        parts.append(f'SELECT {column} AS name FROM {table}')
+        parts.append(f'SELECT variant.value->>\'name\' FROM {table}, '
+                     f'jsonb_each({variants}->\'variants\') variant')
+    return (f'SELECT name FROM ({" UNION ALL ".join(parts)}) refs '
+            'WHERE name <> \'\'')
+
+
+def python_references():
+    """Имена файлов из БД без SQL конкретной СУБД."""
+    names = set()
+    for label, spec in IMAGE_SPECS.items():
+        rows = apps.get_model(label).objects.values_list(
+            spec.field, spec.variants_field).iterator()
+        for name, variants in rows:
+            names.add(name)
+            names.update(variant['name'] for variant
+                         in (variants or {}).get('variants', {}).values())
+    names.discard('')
+    names.discard(None)
+    return names
+
+
+def references():
+    """Все имена файлов из БД по возрастанию, серверным курсором."""
+    if connection.vendor != 'postgresql':
+        yield from sorted(python_references())
+        return
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(f'{reference_sql()} ORDER BY name COLLATE "C"')
+        while True:
+            rows = cursor.fetchmany(GC_MEDIA_BATCH_SIZE)
+            if not rows:
+                return
+            for name, in rows:
+                yield name
+
+
+def referenced(names):
+    """Имена из списка, на которые сейчас есть ссылки в БД."""
+    if connection.vendor != 'postgresql':
+        return python_references().intersection(names)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT name FROM ({reference_sql()}) checked '
+                       'WHERE name = ANY(%s)', (list(names),))
+        return {name for name, in cursor.fetchall()}
+
+
+class Command(BaseCommand):
+    """Удаление медиафайлов, на которые не ссылается ни один объект.
+
+    Файлы каталогов загрузки изображений и имена из БД читаются
+    отсортированными потоками и сливаются без загрузки в память.
+    Кандидаты удаляются пачками: перед удалением пачки ссылки
+    проверяются снова, а файлы моложе --min-age секунд пропускаются,
+    чтобы не задеть загрузку, ещё не сохранённую в БД.
+    """
+
+    help = 'Удаляет неиспользуемые изображения из медиа-каталога'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--batch-size', type=int,
+                            default=GC_MEDIA_BATCH_SIZE)
+        parser.add_argument('--min-age', type=float,
+                            default=GC_MEDIA_MIN_AGE,
+                            help='Не удалять файлы моложе, с.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        """Запуск сборки мусора."""
+        if not isinstance(default_storage, FileSystemStorage):
+            raise CommandError('Поддерживается только файловое хранилище.')
+        root = default_storage.location
+        directories = sorted({
+            apps.get_model(label)._meta.get_field(spec.field)
+            .upload_to.rstrip('/')
+            for label, spec in IMAGE_SPECS.items()})
+        files = (name for directory in directories
+                 for name in walk(root, directory))
+        deadline = time.time() - options['min_age']
+        deleted = kept = 0
+        for batch in chunked(orphans(files, references()),
+                             options['batch_size']):
+            still_used = referenced(batch)
+            for name in batch:
+                try:
+                    modified = os.path.getmtime(default_storage.path(name))
+                except FileNotFoundError:
+                    continue
+                if name in still_used or modified > deadline:
+                    kept += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+                deleted += 1
+        action = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {deleted}, оставлено свежих или '
+            f'используемых: {kept}.'))
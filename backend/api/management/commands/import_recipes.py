@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.constants import TRANSFER_BATCH_SIZE
+from api.transfer import import_recipes
+
+
+class Command(BaseCommand):
+    """Загрузка рецептов из NDJSON, выгруженного export_recipes."""
+
+    help = 'Загружает рецепты из NDJSON пачками'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл для загрузки, по умолчанию stdin.')
+        parser.add_argument('--batch-size', type=int,
+                            default=TRANSFER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        """Запуск загрузки."""
+        try:
+            if options['path'] == '-':
+                totals = import_recipes(sys.stdin, options['batch_size'])
+            else:
+                with open(options['path'], encoding='utf-8') as file:
+                    totals = import_recipes(file, options['batch_size'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {totals["created"]}, '
+            f'пропущено: {totals["skipped"]}, '
+            f'новых ингредиентов: {totals["ingredients"]}.'))
@@ -0,0 +1,156 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.autocomplete import ingredient_index
+from api.conditional import INGREDIENTS, bump_counters
+from recipe.models import Ingredient
+
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / 'data' / 'ingredients.csv'
+JSON_BLOCK_SIZE = 1 << 16
+JSON_SKIP = ' \t\r\n,'
+
+
+def read_csv(file):
+    """Строки CSV вида «название,единица измерения»."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива объектов name/measurement_unit."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_BLOCK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов.')
+    pos, eof = 1, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in JSON_SKIP:
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError('Конец блока', buffer, pos)
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON.')
+            block = file.read(JSON_BLOCK_SIZE)
+            eof = not block
+            buffer, pos = buffer[pos:] + block, 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def chunked(rows, size):
+    """Разбивает поток строк на списки размером size."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean(rows):
+    """Обрезает пробелы и пропускает пустые строки."""
+    for name, measurement_unit in rows:
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if name and measurement_unit:
+            yield name, measurement_unit
+
+
+class Command(BaseCommand):
+    """Загрузка каталога ингредиентов.
+
+    Повторный запуск не создаёт дубликатов: строки с уже существующей
+    парой (name, measurement_unit) пропускаются.
+    """
+
+    help = 'Загрузка ингредиентов из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument('--format', choices=tuple(READERS),
+                            help='Формат файла, по умолчанию по расширению.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Не использовать COPY на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        """Запуск загрузки."""
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path.name}')
+
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        load = self.load_copy if use_copy else self.load_bulk
+        before = Ingredient.objects.count()
+        start = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = clean(READERS[file_format](file))
+            total = load(chunked(rows, options['chunk_size']))
+        elapsed = time.perf_counter() - start
+        created = Ingredient.objects.count() - before
+        ingredient_index.invalidate()
+        bump_counters(INGREDIENTS)
+
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total}, добавлено: {created} '
+            f'за {elapsed:.2f} с ({rate:,.0f} строк/с).'))
+
+    def load_bulk(self, chunks):
+        """Загрузка через bulk_create с пропуском конфликтов."""
+        total = 0
+        for chunk in chunks:
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in chunk),
+                    batch_size=len(chunk),
+                    ignore_conflicts=True,
+                )
+            total += len(chunk)
+        return total
+
+    def load_copy(self, chunks):
+        """Загрузка через COPY во временную таблицу и INSERT ON CONFLICT."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_load '
+                '(name text, measurement_unit text) ON COMMIT DROP')
+            for chunk in chunks:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_load (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer)
+                total += len(chunk)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            cursor.execute('DROP TABLE ingredient_load')
+        return total
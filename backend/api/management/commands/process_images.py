@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.constants import IMAGE_WORKER_BATCH_SIZE, IMAGE_WORKER_INTERVAL
+from api.images import process_pending
+
+
+class Command(BaseCommand):
+    """Воркер очереди обработки изображений."""
+
+    help = 'Создаёт уменьшенные варианты изображений из очереди'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать очередь и завершиться.')
+        parser.add_argument('--batch-size', type=int,
+                            default=IMAGE_WORKER_BATCH_SIZE)
+        parser.add_argument('--interval', type=float,
+                            default=IMAGE_WORKER_INTERVAL,
+                            help='Пауза между опросами пустой очереди, с.')
+
+    def handle(self, *args, **options):
+        """Запуск воркера."""
+        total = 0
+        while True:
+            processed = process_pending(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Обработано задач: {total}')
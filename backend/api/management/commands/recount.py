@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipe.models import Favourite, Recipe
+
+User = get_user_model()
+
+
+def count_subquery(model, field):
+    """Подзапрос числа строк model, ссылающихся на объект."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def repair(model, counter, actual):
+    """Исправляет счётчик в строках, где он расходится с данными."""
+    drifted = model.objects.annotate(actual=actual).exclude(
+        **{counter: F('actual')}).values('pk')
+    return model.objects.filter(pk__in=drifted).update(**{counter: actual})
+
+
+class Command(BaseCommand):
+    """Пересчёт денормализованных счётчиков."""
+
+    help = ('Пересчитывает счётчики избранного рецептов '
+            'и числа рецептов пользователей')
+
+    def handle(self, *args, **options):
+        """Запуск команды."""
+        with transaction.atomic():
+            recipes = repair(Recipe, 'favorites_count',
+                             count_subquery(Favourite, 'recipe'))
+            users = repair(User, 'recipes_count',
+                           count_subquery(Recipe, 'author'))
+        self.stdout.write(
+            f'Исправлено рецептов: {recipes}, пользователей: {users}')
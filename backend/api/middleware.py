@@ -0,0 +1,76 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.timing')
+
+
+class QueryStats:
+    """Обёртка выполнения запросов: число, время и повторы."""
+
+    def __init__(self):
+        """Пустая статистика."""
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        """Выполняет запрос и учитывает его."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    @property
+    def duplicates(self):
+        """Число повторных выполнений одинаковых запросов."""
+        return self.count - len(self.statements)
+
+
+class QueryTimingMiddleware:
+    """Считает SQL-запросы и время запроса.
+
+    Добавляет заголовок Server-Timing и пишет структурированную
+    строку лога для запросов дольше SLOW_REQUEST_THRESHOLD_MS.
+    Запросы, выполненные при отдаче потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        """Инициализация middleware."""
+        self.get_response = get_response
+        self.threshold = settings.SLOW_REQUEST_THRESHOLD_MS / 1000
+
+    def __call__(self, request):
+        """Обработка запроса."""
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries",'
+            f' app;dur={(total - stats.duration) * 1000:.1f},'
+            f' total;dur={total * 1000:.1f}'
+        )
+        if total >= self.threshold:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'db_ms': round(stats.duration * 1000, 1),
+                'queries': stats.count,
+                'duplicate_queries': stats.duplicates,
+            }, ensure_ascii=False))
+        return response
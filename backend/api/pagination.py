@@ -1,4 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from .constants import PAGE_SIZE
 
@@ -8,3 +17,153 @@ class CustomPagination(PageNumberPagination):
 
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по ключу (pub_date, id) в порядке убывания.
+
+    Вместо COUNT и OFFSET страница выбирается условием по ключу
+    последней записи, поэтому любая страница стоит как первая.
+    Запросы со своей сортировкой (ordering, search) отклоняются:
+    курсор задаёт порядок по дате и молча потерял бы её.
+    """
+
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering_query_params = ('ordering', 'search')
+    invalid_cursor_message = 'Неверный курсор.'
+    ordering_message = ('Курсорная пагинация не сочетается '
+                        'с параметрами {}.')
+
+    def get_page_size(self, request):
+        """Размер страницы из параметра limit."""
+        limit = request.query_params.get(self.page_size_query_param, '')
+        if limit.isdigit() and int(limit) > 0:
+            return int(limit)
+        return self.page_size
+
+    def encode_cursor(self, reverse, recipe):
+        """Кодирует позицию записи в строку курсора."""
+        position = (f'{int(reverse)}|{recipe.pub_date.isoformat()}|'
+                    f'{recipe.pk}')
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        """Разбирает курсор из запроса: (reverse, pub_date, id) или None."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = base64.urlsafe_b64decode(encoded.encode()).decode()
+            reverse, pub_date, pk = position.split('|')
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None or reverse not in ('0', '1'):
+                raise ValueError
+            return reverse == '1', pub_date, int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def check_ordering(self, request):
+        """Ошибка 400, если запрос задаёт свою сортировку."""
+        ordered = [name for name in self.ordering_query_params
+                   if request.query_params.get(name, '').strip()]
+        if ordered:
+            raise ValidationError(
+                {'errors': self.ordering_message.format(', '.join(ordered))})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Возвращает записи страницы."""
+        self.check_ordering(request)
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[0]
+
+        if cursor is None:
+            queryset = queryset.order_by('-pub_date', '-id')
+        elif reverse:
+            _, pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__gte=pub_date)
+                & (Q(pub_date__gt=pub_date) | Q(id__gt=pk))
+            ).order_by('pub_date', 'id')
+        else:
+            _, pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lte=pub_date)
+                & (Q(pub_date__lt=pub_date) | Q(id__lt=pk))
+            ).order_by('-pub_date', '-id')
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = results
+        return results
+
+    def get_link(self, reverse):
+        """Ссылка на соседнюю страницу."""
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return None
+        recipe = self.page[0] if reverse else self.page[-1]
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(reverse, recipe))
+
+    def get_next_link(self):
+        """Ссылка на следующую страницу."""
+        if not self.has_next:
+            return None
+        return self.get_link(reverse=False)
+
+    def get_previous_link(self):
+        """Ссылка на предыдущую страницу."""
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(),
+                                      self.cursor_query_param)
+        return self.get_link(reverse=True)
+
+    def get_paginated_response(self, data):
+        """Ответ со ссылками на соседние страницы."""
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        )))
+
+
+class RecipePagination(CustomPagination):
+    """Номерная пагинация рецептов с курсорным режимом по запросу.
+
+    Курсорный режим включается параметром pagination=cursor
+    или наличием параметра cursor.
+    """
+
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        """Проверяет, запрошен ли курсорный режим."""
+        return (self.keyset_class.cursor_query_param in request.query_params
+                or request.query_params.get(self.mode_query_param)
+                == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Выбирает режим пагинации и возвращает записи страницы."""
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """Ответ в формате выбранного режима."""
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
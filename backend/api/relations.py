@@ -0,0 +1,52 @@
+"""Связи текущего пользователя в пределах одного запроса.
+
+Подписки, избранное и список покупок загружаются при первом
+обращении одним запросом каждое и дальше отвечают на проверки флагов
+всех сериализаторов запроса, включая вложенные.
+"""
+from django.utils.functional import cached_property
+
+from recipe.models import Favourite, Follow, ShoppingCart
+
+REQUEST_ATTRIBUTE = '_user_relations'
+
+
+class UserRelations:
+    """Множества id, связанных с пользователем."""
+
+    def __init__(self, user):
+        """Связи пользователя; у анонимного их нет."""
+        self.user = user if user.is_authenticated else None
+
+    def ids(self, queryset, field):
+        """Множество значений поля для связей пользователя."""
+        if self.user is None:
+            return frozenset()
+        return frozenset(queryset.values_list(field, flat=True))
+
+    @cached_property
+    def following(self):
+        """Id авторов, на которых подписан пользователь."""
+        return self.ids(Follow.objects.filter(user=self.user), 'author_id')
+
+    @cached_property
+    def favourites(self):
+        """Id рецептов в избранном."""
+        return self.ids(Favourite.objects.filter(author=self.user),
+                        'recipe_id')
+
+    @cached_property
+    def shopping_cart(self):
+        """Id рецептов в списке покупок."""
+        return self.ids(ShoppingCart.objects.filter(author=self.user),
+                        'recipe_id')
+
+
+def get_relations(request):
+    """Связи пользователя запроса, общие для всех сериализаторов."""
+    http_request = getattr(request, '_request', request)
+    relations = getattr(http_request, REQUEST_ATTRIBUTE, None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        setattr(http_request, REQUEST_ATTRIBUTE, relations)
+    return relations
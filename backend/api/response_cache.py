@@ -0,0 +1,116 @@
+"""Кэш ответов списка и детального просмотра рецептов.
+
+Тело ответа кэшируется в анонимном виде. Ключ включает параметры
+запроса и значение счётчика изменений рецептов из БД - того же, что
+входит в ETag. Сигналы увеличивают счётчик, старые записи просто
+перестают читаться и истекают по таймауту. Версия берётся из БД,
+а не из кэша, поэтому изменение видят все воркеры, даже если кэш
+у каждого свой.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipe.models import Favourite, Follow, ShoppingCart
+from .conditional import RECIPES, get_counters
+from .constants import POPULAR_ORDERING
+
+LIST_KEY = 'recipes:list:{}:{}'
+DETAIL_KEY = 'recipes:detail:{}:{}:{}'
+PERSONAL_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def digest(*parts):
+    """Короткий хэш частей ключа."""
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def recipes_version(request):
+    """Значение счётчика изменений рецептов.
+
+    conditional_response уже прочитал его для ETag, повторного
+    запроса к БД нет.
+    """
+    counters = getattr(request, 'change_counters', None)
+    if counters is None or RECIPES not in counters:
+        counters, _ = get_counters((RECIPES,))
+    return counters[RECIPES]
+
+
+def build_key(request, pk=None):
+    """Ключ кэша для запроса списка или рецепта."""
+    params = '&'.join(sorted(
+        f'{name}={value}'
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+    request_digest = digest(request.get_host(), request.path, params)
+    version = recipes_version(request)
+    if pk is None:
+        return LIST_KEY.format(version, request_digest)
+    return DETAIL_KEY.format(pk, version, request_digest)
+
+
+def is_popular(request):
+    """Запрос списка с сортировкой по популярности."""
+    return request.query_params.get('ordering') == POPULAR_ORDERING
+
+
+def is_cacheable(request):
+    """Персональные фильтры авторизованных пользователей не кэшируются.
+
+    Сортировка по популярности меняется с каждым добавлением
+    в избранное и тоже не кэшируется.
+    """
+    if is_popular(request):
+        return False
+    if not request.user.is_authenticated:
+        return True
+    return not any(request.query_params.get(name) not in (None, '', '0')
+                   for name in PERSONAL_FILTERS)
+
+
+def merge_user_flags(recipes, user):
+    """Проставляет флаги пользователя в анонимные данные рецептов."""
+    recipe_ids = [recipe['id'] for recipe in recipes]
+    author_ids = [recipe['author']['id'] for recipe in recipes]
+    favorited = set(Favourite.objects.filter(
+        author=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    in_cart = set(ShoppingCart.objects.filter(
+        author=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    followed = set(Follow.objects.filter(
+        user=user, author_id__in=author_ids
+    ).values_list('author_id', flat=True))
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in favorited
+        recipe['is_in_shopping_cart'] = recipe['id'] in in_cart
+        recipe['author']['is_subscribed'] = recipe['author']['id'] in followed
+
+
+def cached_response(request, render, pk=None):
+    """Ответ из кэша либо результат render().
+
+    Анонимный ответ сохраняется в кэш. Авторизованный пользователь
+    при попадании получает кэшированное тело со своими флагами,
+    при промахе — обычный ответ.
+    """
+    if not is_cacheable(request):
+        return render()
+    key = build_key(request, pk)
+    data = cache.get(key)
+    if data is None:
+        response = render()
+        if (response.status_code == status.HTTP_200_OK
+                and not request.user.is_authenticated):
+            cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+        return response
+    if request.user.is_authenticated:
+        recipes = data['results'] if pk is None else [data]
+        if recipes:
+            merge_user_flags(recipes, request.user)
+    return Response(data)
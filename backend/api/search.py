@@ -0,0 +1,143 @@
+"""Полнотекстовый поиск рецептов по названию, ингредиентам и тексту.
+
+PostgreSQL: столбец tsvector recipe_recipe.search_vector с GIN-индексом
+и русской морфологией. SQLite: таблица FTS5 recipe_search, поиск
+по префиксам слов с отброшенными окончаниями. Оба индекса создаёт миграция
+recipe.0013_recipe_search, сигналы обновляют их после фиксации
+транзакции для изменённых рецептов.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from recipe.models import Ingredient, Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+WORD_RE = re.compile(r'\w+')
+# Окончания русских слов для поиска без морфологии, длинные первыми.
+ENDINGS = (
+    'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев',
+    'ую', 'юю', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+)
+MIN_STEM_LENGTH = 3
+
+
+def stem(word):
+    """Слово без окончания: основа для поиска по префиксу."""
+    word = word.lower()
+    for ending in ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def quote(name):
+    """Имя таблицы или столбца в кавычках."""
+    return connection.ops.quote_name(name)
+
+
+RECIPE_TABLE = quote(Recipe._meta.db_table)
+
+
+def ingredient_names(aggregate):
+    """Подзапрос названий ингредиентов рецепта одной строкой."""
+    through = quote(RecipeIngredient._meta.db_table)
+    ingredient = quote(Ingredient._meta.db_table)
+    return (f'SELECT {aggregate}({ingredient}.name, \' \') FROM {through} '
+            f'JOIN {ingredient} ON {ingredient}.id = {through}.ingredients_id '
+            f'WHERE {through}.recipe_id = {RECIPE_TABLE}.id')
+
+
+class PostgresSearch:
+    """Поиск по tsvector с весами: название A, ингредиенты B, текст C."""
+
+    def update(self, recipe_ids):
+        """Пересчитывает search_vector рецептов одним запросом."""
+        names = ingredient_names('string_agg')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {RECIPE_TABLE} SET search_vector = '
+                'setweight(to_tsvector(%s, name), \'A\') || '
+                f'setweight(to_tsvector(%s, coalesce(({names}), \'\')), '
+                '\'B\') || setweight(to_tsvector(%s, text), \'C\') '
+                'WHERE id = ANY(%s)',
+                (SEARCH_CONFIG, SEARCH_CONFIG, SEARCH_CONFIG,
+                 list(recipe_ids))
+            )
+
+    def search(self, queryset, query):
+        """Рецепты, подходящие под запрос, с рангом search_rank."""
+        tsquery = 'websearch_to_tsquery(%s, %s)'
+        params = (SEARCH_CONFIG, query)
+        return queryset.filter(RawSQL(
+            f'{RECIPE_TABLE}.search_vector @@ {tsquery}', params,
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank_cd({RECIPE_TABLE}.search_vector, {tsquery})', params,
+            output_field=FloatField()
+        ))
+
+
+class SqliteSearch:
+    """Поиск по FTS5 для локальной разработки на SQLite."""
+
+    table = 'recipe_search'
+
+    def update(self, recipe_ids):
+        """Перезаписывает строки индекса рецептов."""
+        recipe_ids = list(recipe_ids)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        names = ingredient_names('group_concat')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                recipe_ids)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, ingredients, text) '
+                f'SELECT id, name, coalesce(({names}), \'\'), text '
+                f'FROM {RECIPE_TABLE} WHERE id IN ({placeholders})',
+                recipe_ids)
+
+    def search(self, queryset, query):
+        """Рецепты со словами, начинающимися с основ слов запроса."""
+        words = WORD_RE.findall(query)
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{stem(word)}"*' for word in words)
+        return queryset.filter(RawSQL(
+            f'{RECIPE_TABLE}.id IN (SELECT rowid FROM {self.table} '
+            f'WHERE {self.table} MATCH %s)', (match,),
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'(SELECT -bm25({self.table}, 10.0, 5.0, 1.0) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {RECIPE_TABLE}.id)',
+            (match,), output_field=FloatField()
+        ))
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch(),
+    'sqlite': SqliteSearch(),
+}
+
+
+def update_search_index(recipe_ids):
+    """Обновляет поисковый индекс рецептов."""
+    recipe_ids = list(recipe_ids)
+    backend = BACKENDS.get(connection.vendor)
+    if recipe_ids and backend is not None:
+        backend.update(recipe_ids)
+
+
+def search_recipes(queryset, query):
+    """Рецепты по запросу в порядке релевантности."""
+    backend = BACKENDS.get(connection.vendor)
+    if backend is None:
+        return queryset.filter(name__icontains=query)
+    return backend.search(queryset, query).order_by(
+        '-search_rank', '-pub_date', '-id')
@@ -1,9 +1,10 @@
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 
 from recipe.constants import MIN_VALUE
+from .constants import BULK_RECIPES_LIMIT
 from recipe.models import (Favourite,
                            Follow,
                            Ingredient,
@@ -11,6 +12,8 @@ from recipe.models import (Favourite,
                            RecipeIngredient,
                            ShoppingCart,
                            Tag)
+from .images import ImageVariantsField
+from .relations import get_relations
 from user.serializers import UserReadSerializer
 
 
@@ -40,6 +43,7 @@ class BaseSerializer(serializers.ModelSerializer):
     id = serializers.PrimaryKeyRelatedField(source='recipe', read_only=True)
     name = serializers.ReadOnlyField(source='recipe.name')
     image = serializers.ImageField(source='recipe.image', read_only=True)
+    image_variants = ImageVariantsField(source='recipe')
     cooking_time = serializers.IntegerField(
         source='recipe.cooking_time', read_only=True
     )
@@ -47,7 +51,7 @@ class BaseSerializer(serializers.ModelSerializer):
     class Meta:
         """Класс Мета."""
 
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class FavouriteSerializer(BaseSerializer):
@@ -68,6 +72,16 @@ class ShoppingCartSerializer(BaseSerializer):
         model = ShoppingCart
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сеализатор списка id рецептов для пакетных операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_VALUE),
+        allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT
+    )
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сеализатор для связанной модели."""
 
@@ -90,6 +104,7 @@ class BaseRecipeSerializer(serializers.ModelSerializer):
 
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         """Класс Мета."""
@@ -97,24 +112,23 @@ class BaseRecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'name', 'tags', 'ingredients',
-            'image', 'author', 'text', 'cooking_time',
+            'image', 'image_variants', 'author', 'text', 'cooking_time',
             'is_favorited', 'is_in_shopping_cart'
         )
 
     def get_is_favorited(self, obj):
         """Метод поля на проверку в избранное."""
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Favourite.objects.filter(author=user, recipe=obj).exists()
-        return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        request = self.context.get('request')
+        return obj.pk in get_relations(request).favourites
 
     def get_is_in_shopping_cart(self, obj):
         """Метод поля на проверку в списке покупок."""
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return ShoppingCart.objects.filter(
-                author=user, recipe=obj).exists()
-        return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        request = self.context.get('request')
+        return obj.pk in get_relations(request).shopping_cart
 
 
 class RecipeReadSerializer(BaseRecipeSerializer):
@@ -132,8 +146,7 @@ class RecipeReadSerializer(BaseRecipeSerializer):
 class AddIngredientSerializer(serializers.ModelSerializer):
     """Сеализатор для создание ингредиентов."""
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=MIN_VALUE)
 
     class Meta:
@@ -186,18 +199,23 @@ class RecipeWriteSerializer(BaseRecipeSerializer):
         if not ingredients:
             raise ValidationError('Выберите ингредиенты.')
 
-        ingredient_list = []
+        ids = [ingredient.get('id') for ingredient in ingredients]
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ингредиенты повторяются!')
 
         for ingredient in ingredients:
-            item = get_object_or_404(Ingredient, pk=ingredient.get('id').pk)
-            if item in ingredient_list:
-                raise ValidationError('Ингредиенты повторяются!')
-
             if int(ingredient.get('amount')) <= 1:
                 raise ValidationError('Количество должно быть больше единицы!')
 
-            ingredient_list.append(item)
+        existing = Ingredient.objects.in_bulk(ids)
+        missing = set(ids) - existing.keys()
+        if missing:
+            raise ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}.')
 
+        for ingredient in ingredients:
+            ingredient['id'] = existing[ingredient.get('id')]
         return value
 
     def validate_tags(self, value):
@@ -207,24 +225,23 @@ class RecipeWriteSerializer(BaseRecipeSerializer):
         if not tags:
             raise ValidationError('Нужно выбрать тег!')
 
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise ValidationError('Теги не должны повторятся!')
-
-            tags_list.append(tag)
+        if len(set(tags)) != len(tags):
+            raise ValidationError('Теги не должны повторятся!')
         return value
 
     def add_tags_ingredients(self, ingredients, tags, recipe):
         """Метод для добавление записи тегов и ингредиентовв модели."""
-        for ingredient in ingredients:
-            RecipeIngredient.objects.update_or_create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
                 ingredients=ingredient.get('id'),
                 amount=ingredient.get('amount')
             )
+            for ingredient in ingredients
+        )
         recipe.tags.set(tags)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Метод создания записи."""
         ingredients = validated_data.pop('ingredients')
@@ -233,6 +250,7 @@ class RecipeWriteSerializer(BaseRecipeSerializer):
         self.add_tags_ingredients(ingredients, tags, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Метод обновления записи."""
         if ('ingredients' not in self.initial_data
@@ -248,7 +266,8 @@ class RecipeWriteSerializer(BaseRecipeSerializer):
         """Метод для вывода данных."""
         recipe = super().to_representation(instance)
         recipe['ingredients'] = RecipeIngredientSerializer(
-            instance.recipe_ingredients.all(), many=True).data
+            instance.recipe_ingredients.select_related('ingredients'),
+            many=True).data
         recipe['tags'] = TagSerializer(
             instance.tags.all(), many=True
         ).data
@@ -262,11 +281,13 @@ class RecipeWriteSerializer(BaseRecipeSerializer):
 class RecipeAuthorSerializer(serializers.ModelSerializer):
     """Сеализатор для вывода рецептов подписок."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         """Класс Мета."""
 
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image',)
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_variants')
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -278,6 +299,7 @@ class FollowSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     avatar = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField(source='author')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
@@ -288,7 +310,7 @@ class FollowSerializer(serializers.ModelSerializer):
         model = Follow
         fields = ('email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'recipes',
-                  'recipes_count', 'avatar')
+                  'recipes_count', 'avatar', 'avatar_variants')
 
     def get_avatar(self, obj):
         """Метод получения ссылки аватара."""
@@ -299,25 +321,31 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод на проверку подписки."""
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(
-                user=obj.user,
-                author=obj.author).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        return obj.author_id in get_relations(request).following
 
     def get_recipes(self, obj):
-        """Метод для получения рецептов подписки."""
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
+        """Метод для получения рецептов подписки.
+
+        Если во вьюсете рецепты подгружены пачкой, они передаются
+        в контексте как словарь author_id -> список рецептов.
+        """
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.author_id, [])
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = Recipe.objects.filter(author=obj.author)
+            if limit and limit.isdigit():
+                recipes = recipes[:int(limit)]
         return RecipeAuthorSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
         """Метод подсчёта рецептов подписки."""
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def validate(self, data):
         """Метод валидация полей."""
@@ -0,0 +1,121 @@
+"""Формирование файла списка покупок."""
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.db.models import Sum
+
+from recipe.models import RecipeIngredient
+from .constants import SHOPPING_LIST_CHUNK_SIZE
+
+EMPTY_CART_MESSAGE = 'Your shopping cart is empty.'
+TITLE = 'Список покупок:'
+PDF_FONT_NAME = 'ShoppingListFont'
+
+
+def get_shopping_list(user):
+    """Суммарное количество ингредиентов из списка покупок.
+
+    Одна сгруппированная выборка SUM(amount) по RecipeIngredient,
+    присоединённому через ShoppingCart. Строки отдаются итератором.
+    """
+    return (RecipeIngredient.objects
+            .filter(recipe__shopping_carts__author=user)
+            .values_list('ingredients__name',
+                         'ingredients__measurement_unit')
+            .annotate(total=Sum('amount'))
+            .order_by('ingredients__name', 'ingredients__measurement_unit')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE))
+
+
+def render_txt(rows):
+    """Построчная генерация текстового файла."""
+    yield f'{TITLE} \n'
+    empty = True
+    for name, measurement_unit, total in rows:
+        empty = False
+        yield f'* {name} ({measurement_unit}) - {total} \n'
+    if empty:
+        yield f'{EMPTY_CART_MESSAGE}\n'
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        """Метод записи."""
+        return value
+
+
+def render_csv(rows):
+    """Построчная генерация CSV файла."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Продукт', 'Единица измерения', 'Количество'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def get_pdf_font():
+    """Регистрирует шрифт с кириллицей, если он доступен."""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    font_path = settings.SHOPPING_LIST_FONT
+    if font_path and os.path.exists(font_path):
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+        return PDF_FONT_NAME
+    return 'Helvetica'
+
+
+def render_pdf(rows):
+    """Генерация PDF файла, отдаётся частями.
+
+    Документ собирается в буфер размером с итоговый файл:
+    список уже сгруппирован и ограничен размером каталога ингредиентов.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    font = get_pdf_font()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = 20 * mm
+    line_height = 7 * mm
+    y = height - margin
+
+    def new_line(text, size=12):
+        nonlocal y
+        if y < margin:
+            pdf.showPage()
+            y = height - margin
+        pdf.setFont(font, size)
+        pdf.drawString(margin, y, text)
+        y -= line_height
+
+    new_line(TITLE, size=16)
+    empty = True
+    for name, measurement_unit, total in rows:
+        empty = False
+        new_line(f'• {name} ({measurement_unit}) - {total}')
+    if empty:
+        new_line(EMPTY_CART_MESSAGE)
+    pdf.save()
+
+    buffer.seek(0)
+    while True:
+        chunk = buffer.read(SHOPPING_LIST_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
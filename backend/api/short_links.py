@@ -0,0 +1,108 @@
+"""Короткие ссылки на рецепты."""
+import string
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from recipe.models import Recipe
+from .constants import (SHORT_LINK_CACHE_TIMEOUT,
+                        SHORT_LINK_LOCAL_SIZE,
+                        SHORT_LINK_LOCAL_TTL)
+
+ALPHABET = string.digits + string.ascii_letters
+CACHE_KEY = 'short_link:{}'
+
+
+def encode_short_code(pk):
+    """Код рецепта: первичный ключ в base62.
+
+    Разные pk дают разные коды, поэтому проверка коллизий не нужна.
+    """
+    if pk <= 0:
+        raise ValueError('pk должен быть положительным.')
+    digits = []
+    while pk:
+        pk, remainder = divmod(pk, len(ALPHABET))
+        digits.append(ALPHABET[remainder])
+    return ''.join(reversed(digits))
+
+
+class LocalLRU:
+    """Небольшой потокобезопасный LRU-кэш процесса с временем жизни."""
+
+    def __init__(self, maxsize, ttl):
+        """Размер и время жизни записей в секундах."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Значение по ключу или None."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Сохраняет значение, вытесняя самые старые записи."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Удаляет значение."""
+        with self._lock:
+            self._data.pop(key, None)
+
+
+local_links = LocalLRU(SHORT_LINK_LOCAL_SIZE, SHORT_LINK_LOCAL_TTL)
+
+
+def get_short_code(recipe):
+    """Возвращает код рецепта, записывая его в БД только при отсутствии."""
+    if recipe.short_code:
+        return recipe.short_code
+    short_code = encode_short_code(recipe.pk)
+    Recipe.objects.filter(
+        pk=recipe.pk, short_code__isnull=True
+    ).update(short_code=short_code)
+    return short_code
+
+
+def resolve_short_code(short_code):
+    """Первичный ключ рецепта по коду или None.
+
+    Сначала LRU процесса, затем кэш Django и только потом БД.
+    """
+    pk = local_links.get(short_code)
+    if pk is not None:
+        return pk
+    pk = cache.get(CACHE_KEY.format(short_code))
+    if pk is None:
+        pk = (Recipe.objects
+              .filter(short_code=short_code)
+              .values_list('pk', flat=True)
+              .first())
+        if pk is None:
+            return None
+        cache.set(CACHE_KEY.format(short_code), pk,
+                  SHORT_LINK_CACHE_TIMEOUT)
+    local_links.set(short_code, pk)
+    return pk
+
+
+def forget_short_code(short_code):
+    """Убирает код из кэшей после удаления рецепта."""
+    local_links.delete(short_code)
+    cache.delete(CACHE_KEY.format(short_code))
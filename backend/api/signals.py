@@ -0,0 +1,230 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_save,
+                                      pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipe.models import (Favourite,
+                           Follow,
+                           Ingredient,
+                           Recipe,
+                           RecipeIngredient,
+                           ShoppingCart,
+                           Tag)
+from .authentication import CLAIM_FIELDS, revocation_list
+from .autocomplete import ingredient_index
+from .images import enqueue_images, needs_variants
+from .conditional import (FAVOURITES, INGREDIENTS, RECIPES, TAGS, USER,
+                          bump_counters)
+from .search import update_search_index
+from .short_links import encode_short_code, forget_short_code
+from .tag_map import tag_map
+
+User = get_user_model()
+# Поля пользователя, которые попадают в ответы с рецептами.
+USER_PUBLIC_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar'))
+# Поля, при изменении которых отзываются подписанные токены пользователя.
+USER_TOKEN_FIELDS = frozenset((*CLAIM_FIELDS, 'is_active', 'password'))
+RECIPE_M2M_FIELDS = {
+    Recipe.tags.through: 'tags',
+    Recipe.ingredients.through: 'ingredients',
+}
+
+
+def touch_recipes_on_commit(recipe_ids):
+    """Сбрасывает ETag и кэш ответов рецептов после фиксации транзакции.
+
+    Счётчик рецептов общий, поэтому он увеличивается, только если
+    изменение затронуло хотя бы один рецепт.
+    """
+    if isinstance(recipe_ids, QuerySet):
+        touched = recipe_ids.exists()
+    else:
+        touched = bool(recipe_ids)
+    if touched:
+        bump_counters_on_commit(RECIPES)
+
+
+def bump_counters_on_commit(*names):
+    """Увеличивает счётчики изменений после фиксации транзакции."""
+    transaction.on_commit(lambda: bump_counters(*names))
+
+
+def index_recipes_on_commit(recipe_ids):
+    """Обновляет поисковый индекс рецептов после фиксации транзакции."""
+    transaction.on_commit(partial(update_search_index, list(recipe_ids)))
+
+
+def shift_counter(queryset, field, delta):
+    """Атомарно меняет счётчик в строках, не опуская его ниже нуля."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс автодополнения при изменении ингредиентов."""
+    transaction.on_commit(ingredient_index.invalidate)
+    bump_counters_on_commit(INGREDIENTS)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    """Название ингредиента входит в поисковый индекс рецептов."""
+    if not created:
+        index_recipes_on_commit(Recipe.objects.filter(
+            ingredients=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    """Название и единица ингредиента входят в ответы рецептов с ним."""
+    if not created:
+        touch_recipes_on_commit(Recipe.objects.filter(
+            ingredients=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_short_link(sender, instance, **kwargs):
+    """Убирает короткую ссылку удалённого рецепта из кэшей."""
+    forget_short_code(encode_short_code(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Изменение рецепта."""
+    touch_recipes_on_commit((instance.pk,))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_changed(sender, instance, update_fields=None, **kwargs):
+    """Новое изображение ставится в очередь на создание вариантов."""
+    if needs_variants(instance, update_fields):
+        transaction.on_commit(partial(
+            enqueue_images, instance._meta.label_lower, (instance.pk,)))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_count_changed(sender, instance, signal, created=False,
+                         **kwargs):
+    """Счётчик рецептов автора."""
+    if signal is post_save and not created:
+        return
+    shift_counter(User.objects.filter(pk=instance.author_id),
+                  'recipes_count', 1 if created else -1)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Изменение ингредиентов рецепта."""
+    touch_recipes_on_commit((instance.recipe_id,))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_text_changed(sender, instance, **kwargs):
+    """Название и текст рецепта входят в поисковый индекс."""
+    index_recipes_on_commit((instance.pk,))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_indexed(sender, instance, **kwargs):
+    """Ингредиенты рецепта входят в поисковый индекс."""
+    index_recipes_on_commit((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_indexed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    """Изменение ингредиентов рецепта через связь M2M."""
+    if not reverse:
+        if action.startswith('post_'):
+            index_recipes_on_commit((instance.pk,))
+    elif action == 'pre_clear':
+        index_recipes_on_commit(Recipe.objects.filter(
+            ingredients=instance).values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        index_recipes_on_commit(pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Изменение тегов или ингредиентов рецепта через связь M2M."""
+    if not reverse:
+        if action.startswith('post_'):
+            touch_recipes_on_commit((instance.pk,))
+    elif action == 'pre_clear':
+        field = RECIPE_M2M_FIELDS[sender]
+        touch_recipes_on_commit(Recipe.objects.filter(
+            **{field: instance}).values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes_on_commit(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    """Изменение тега затрагивает все рецепты с ним."""
+    touch_recipes_on_commit(
+        instance.recipes.values_list('pk', flat=True))
+    transaction.on_commit(tag_map.invalidate)
+    bump_counters_on_commit(TAGS)
+
+
+@receiver((post_save, post_delete), sender=Favourite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def user_recipe_list_changed(sender, instance, **kwargs):
+    """Избранное и список покупок меняют флаги рецептов пользователя."""
+    bump_counters_on_commit(USER.format(instance.author_id))
+
+
+@receiver((post_save, post_delete), sender=Favourite)
+def favourite_count_changed(sender, instance, signal, created=False,
+                            **kwargs):
+    """Счётчик добавлений рецепта в избранное."""
+    if signal is post_save and not created:
+        return
+    shift_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                  'favorites_count', 1 if created else -1)
+    bump_counters_on_commit(FAVOURITES)
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    """Подписка меняет флаг is_subscribed у авторов рецептов."""
+    bump_counters_on_commit(USER.format(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    """Изменение публичных данных автора затрагивает его рецепты."""
+    if created or (update_fields is not None
+                   and USER_PUBLIC_FIELDS.isdisjoint(update_fields)):
+        return
+    touch_recipes_on_commit(
+        instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(pre_save, sender=User)
+def user_token_fields_changed(sender, instance, update_fields=None,
+                              **kwargs):
+    """Смена пароля, роли или блокировка отзывают токены пользователя."""
+    if instance._state.adding or (
+            update_fields is not None
+            and USER_TOKEN_FIELDS.isdisjoint(update_fields)):
+        return
+    fields = USER_TOKEN_FIELDS.difference(instance.get_deferred_fields())
+    stored = User.objects.filter(pk=instance.pk).values(*fields).first()
+    if stored is not None and any(
+            stored[field] != getattr(instance, field) for field in fields):
+        revocation_list.revoke(instance.pk)
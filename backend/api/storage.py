@@ -0,0 +1,44 @@
+"""Хранилище медиафайлов с именами по содержимому.
+
+Файл сохраняется как <каталог>/<xx>/<sha256><расширение>, где xx -
+первые символы хэша. Одинаковые файлы хранятся один раз, поэтому
+приложение их не удаляет: неиспользуемые файлы убирает команда
+manage.py gc_media.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с дедупликацией по SHA-256."""
+
+    def hashed_name(self, name, content):
+        """Имя файла по хэшу содержимого в каталоге исходного имени."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, base = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(base)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        """Сохраняет файл, если такого содержимого ещё нет.
+
+        У существующего файла обновляется время изменения: gc_media
+        не удаляет недавно изменённые файлы, и повторно загруженный
+        файл не пропадёт, пока ссылка на него не попала в БД.
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
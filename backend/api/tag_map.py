@@ -0,0 +1,48 @@
+"""Соответствие слагов тегов и их id в памяти процесса."""
+from recipe.models import Tag
+from .constants import TAG_MAP_TTL
+from .versioned_cache import VersionedCache
+
+TAG_MAP_VERSION_KEY = 'tag_map_version'
+
+
+class TagMap(VersionedCache):
+    """Словарь slug -> id для проверки фильтра без запросов к БД.
+
+    Перестраивается лениво при смене версии в кэше Django (её
+    увеличивают сигналы изменения тегов) либо по истечении TAG_MAP_TTL
+    секунд. Тег, созданный в другом воркере, может быть ещё неизвестен
+    словарю, поэтому неизвестные слаги проверяются по БД.
+    """
+
+    version_key = TAG_MAP_VERSION_KEY
+    ttl = TAG_MAP_TTL
+
+    def __init__(self):
+        """Пустой словарь, строится при первом обращении."""
+        super().__init__()
+        self._ids = {}
+
+    def load(self):
+        """Загружает теги из БД."""
+        self._ids = dict(Tag.objects.values_list('slug', 'id'))
+
+    def ensure_known(self, slugs):
+        """Перестраивает словарь, если в БД есть неизвестные ему слаги."""
+        self.ensure_fresh()
+        missing = set(slugs).difference(self._ids)
+        if missing and Tag.objects.filter(slug__in=missing).exists():
+            self.rebuild()
+
+    def choices(self):
+        """Варианты для поля фильтра."""
+        self.ensure_fresh()
+        return [(slug, slug) for slug in self._ids]
+
+    def ids(self, slugs):
+        """Id тегов по слагам, неизвестные пропускаются."""
+        self.ensure_fresh()
+        return [self._ids[slug] for slug in slugs if slug in self._ids]
+
+
+tag_map = TagMap()
@@ -1,13 +1,70 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+from contextlib import nullcontext
 from http import HTTPStatus
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import RevocationList
+from api.autocomplete import ingredient_index
+from api.conditional import RECIPES, bump_counters
+from api.constants import RECIPE_IMAGE_VARIANTS
+from api.management.commands.bench import make_image
+from api.short_links import encode_short_code
+from api.throttling import STORES
+
+from recipe.models import (Favourite,
+                           Follow,
+                           ImageJob,
+                           Ingredient,
+                           Recipe,
+                           RecipeIngredient,
+                           ShoppingCart,
+                           Tag)
+
+
+User = get_user_model()
+# счётчики изменений, рецепты, теги, ингредиенты, авторы.
+LIST_QUERIES_WITHOUT_COUNT = 5
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_recipes(count, author, tags, ingredients):
+    """Создаёт рецепты с тегами и ингредиентами для тестов."""
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            name=f'Рецепт {author.username} {number}',
+            author=author,
+            image='recipes/images/test.png',
+            text='Текст',
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredients=ingredient, amount=5)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
 
 
 class RecipeAPITestCase(TestCase):
     def setUp(self):
-        User = get_user_model()
         self.user = User.objects.create_user(username='auth_user')
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
@@ -16,3 +73,1551 @@ class RecipeAPITestCase(TestCase):
         """Проверка доступности списка рецептов."""
         response = self.client.get('/api/recipes/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class RecipeQueryCountTestCase(TestCase):
+    """Число запросов к БД при чтении рецептов не зависит от их числа."""
+
+    # счётчики изменений, count, рецепты, теги, ингредиенты, авторы.
+    LIST_QUERIES = 6
+    # счётчики изменений, рецепт, теги, ингредиенты, автор.
+    DETAIL_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@test.ru')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}',
+                                     email=f'author{i}@test.ru')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            create_recipes(2, author, cls.tags, cls.ingredients)
+        cls.recipe = Recipe.objects.first()
+        Favourite.objects.create(author=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(author=cls.user, recipe=cls.recipe)
+        Follow.objects.create(user=cls.user, author=cls.recipe.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_query_count_is_constant(self):
+        """Список рецептов выполняет фиксированное число запросов."""
+        for limit in (1, 6):
+            with self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list_query_count(self):
+        """Анонимный список рецептов выполняет то же число запросов."""
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = APIClient().get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(any(
+            recipe['is_favorited'] for recipe in response.data['results']))
+
+    def test_detail_query_count(self):
+        """Детальный рецепт выполняет фиксированное число запросов."""
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+        self.assertEqual(len(response.data['tags']), len(self.tags))
+        self.assertEqual(len(response.data['ingredients']),
+                         len(self.ingredients))
+
+
+class DownloadShoppingCartTestCase(TestCase):
+    """Скачивание списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@test.ru')
+        cls.salt = Ingredient.objects.create(name='Соль',
+                                             measurement_unit='г')
+        cls.milk = Ingredient.objects.create(name='Молоко',
+                                             measurement_unit='мл')
+        recipes = create_recipes(5, cls.user, [], [cls.salt, cls.milk])
+        for recipe in recipes:
+            ShoppingCart.objects.create(author=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def download(self, file_format):
+        """Скачивает файл и возвращает ответ и содержимое."""
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'type': file_format})
+        return response, b''.join(response.streaming_content)
+
+    def test_txt_is_aggregated_in_one_query(self):
+        """Количества суммируются одним сгруппированным запросом."""
+        with self.assertNumQueries(1):
+            response, content = self.download('txt')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        text = content.decode()
+        self.assertIn('* Соль (г) - 25', text)
+        self.assertIn('* Молоко (мл) - 25', text)
+
+    def test_csv_and_pdf(self):
+        """Файл формируется в форматах CSV и PDF."""
+        response, content = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('Соль,г,25', content.decode())
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_unknown_format(self):
+        """Неизвестный формат возвращает ошибку."""
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'type': 'doc'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeCreateTestCase(TestCase):
+    """Создание рецепта."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@test.ru')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {i}', measurement_unit='г')
+            for i in range(30)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create(self, name, ingredient_ids):
+        """Отправляет запрос на создание рецепта."""
+        return self.client.post('/api/recipes/', {
+            'name': name,
+            'text': 'Текст',
+            'cooking_time': 5,
+            'image': make_image(),
+            'tags': [self.tag.id],
+            'ingredients': [{'id': pk, 'amount': 10}
+                            for pk in ingredient_ids],
+        }, format='json')
+
+    def test_query_count_does_not_depend_on_ingredients(self):
+        """Число запросов не растёт с числом ингредиентов."""
+        ids = [ingredient.id for ingredient in self.ingredients]
+        with CaptureQueriesContext(connection) as few:
+            response = self.create('Мало', ids[:2])
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        with CaptureQueriesContext(connection) as many:
+            response = self.create('Много', ids)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.data['ingredients']), len(ids))
+
+    def test_invalid_ingredients(self):
+        """Повторы и несуществующие ингредиенты отклоняются."""
+        ids = [self.ingredients[0].id]
+        response = self.create('Повтор', ids * 2)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.create('Нет такого', [0])
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class IngredientAutocompleteTestCase(TestCase):
+    """Автодополнение ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Сахарная пудра', 'Ванильный сахар',
+                         'Сахар', 'Соль', 'сахарин')
+        )
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def search(self, name):
+        """Возвращает названия найденных ингредиентов."""
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_matches_first(self):
+        """Совпадения по префиксу идут раньше совпадений по подстроке."""
+        self.assertEqual(
+            self.search('САХ'),
+            ['Сахар', 'сахарин', 'Сахарная пудра', 'Ванильный сахар'])
+
+    def test_lookup_does_not_touch_db(self):
+        """Поиск по построенному индексу не обращается к БД."""
+        self.search('с')
+        with self.assertNumQueries(0):
+            self.search('со')
+
+    def test_limit(self):
+        """Размер выдачи ограничен."""
+        self.assertEqual(len(ingredient_index.search('с', limit=2)), 2)
+
+    def test_rebuild_on_change(self):
+        """Индекс перестраивается при изменении ингредиентов."""
+        self.assertEqual(self.search('перец'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Перец', measurement_unit='г')
+        self.assertEqual(self.search('перец'), ['Перец'])
+
+
+class LoadIngredientsTestCase(TestCase):
+    """Команда загрузки ингредиентов."""
+
+    def load(self, suffix, content, *args):
+        """Записывает файл и загружает его командой."""
+        with tempfile.NamedTemporaryFile('w', suffix=suffix,
+                                         encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            call_command('load_ingredients', file.name, *args,
+                         stdout=io.StringIO())
+
+    def test_csv_and_json_are_idempotent(self):
+        """Повторная загрузка не создаёт дубликатов."""
+        csv_content = 'соль,г\nсахар,г\nсоль,г\n'
+        json_content = json.dumps([
+            {'name': 'сахар', 'measurement_unit': 'г'},
+            {'name': 'молоко', 'measurement_unit': 'мл'},
+        ])
+        for args in ((), ('--no-copy',)):
+            self.load('.csv', csv_content, *args)
+            self.load('.json', json_content, '--chunk-size', '1', *args)
+            self.assertEqual(
+                sorted(Ingredient.objects.values_list('name', flat=True)),
+                ['молоко', 'сахар', 'соль'])
+
+
+class ShortLinkTestCase(TestCase):
+    """Короткие ссылки на рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='linker', email='linker@test.ru')
+        cls.recipe, = create_recipes(1, cls.author, [], [])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_link(self):
+        """Запрашивает короткую ссылку рецепта."""
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/get-link/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.json()['short-link']
+
+    def test_link_is_stable_and_written_once(self):
+        """Код строится из pk и записывается только один раз."""
+        link = self.get_link()
+        code = encode_short_code(self.recipe.pk)
+        self.assertTrue(link.endswith(f'/r/{code}/'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_link(), link)
+
+    def test_codes_are_unique(self):
+        """Разные pk дают разные коды."""
+        codes = {encode_short_code(pk) for pk in range(1, 10000)}
+        self.assertEqual(len(codes), 9999)
+
+    def test_redirect_is_cached(self):
+        """Повторный переход по ссылке не обращается к БД."""
+        code = encode_short_code(self.recipe.pk)
+        self.get_link()
+        response = self.client.get(f'/r/{code}/')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertTrue(response['Location'].endswith(
+            f'/recipes/{self.recipe.pk}'))
+        with self.assertNumQueries(0):
+            self.client.get(f'/r/{code}/')
+        self.recipe.delete()
+        response = self.client.get(f'/r/{code}/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class RecipeCursorPaginationTestCase(TestCase):
+    """Курсорный режим пагинации рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(username=f'writer{i}',
+                                     email=f'writer{i}@test.ru')
+            for i in range(2)
+        ]
+        for author in cls.authors:
+            create_recipes(7, author, [], [])
+        # Одинаковая дата у части рецептов проверяет ключ (pub_date, id).
+        Recipe.objects.filter(author=cls.authors[0]).update(
+            pub_date=Recipe.objects.first().pub_date)
+
+    def setUp(self):
+        cache.clear()
+
+    def collect(self, url, queries=LIST_QUERIES_WITHOUT_COUNT):
+        """Проходит все страницы и возвращает id рецептов."""
+        ids = []
+        while url:
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_feed_in_order(self):
+        """Страницы идут без пропусков и повторов в порядке ленты."""
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+        self.assertEqual(
+            self.collect('/api/recipes/?pagination=cursor&limit=4'),
+            expected)
+
+    def test_filters_and_previous(self):
+        """Фильтры сохраняются, ссылка назад возвращает прошлую страницу."""
+        author = self.authors[1]
+        first = self.client.get(
+            f'/api/recipes/?pagination=cursor&limit=3&author={author.id}')
+        second = self.client.get(first.data['next'])
+        self.assertTrue(all(recipe['author']['id'] == author.id
+                            for recipe in second.data['results']))
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertEqual(
+            len(self.collect(
+                f'/api/recipes/?pagination=cursor&author={author.id}')),
+            7)
+
+    def test_invalid_cursor(self):
+        """Неверный курсор возвращает 404."""
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_explicit_ordering_is_rejected(self):
+        """Сортировка по популярности или релевантности с курсором - 400."""
+        for params in ('pagination=cursor&ordering=popular',
+                       'cursor=MHwyMDIwLTAxLTAxVDAwOjAwOjAwfDE%3D'
+                       '&ordering=popular',
+                       'pagination=cursor&search=суп'):
+            response = self.client.get(f'/api/recipes/?{params}')
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST,
+                             params)
+        response = self.client.get(
+            '/api/recipes/?pagination=cursor&search=%20&ordering=')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class RecipeFeedTestCase(TestCase):
+    """Лента рецептов авторов из подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader',
+                                              email='reader@test.ru')
+        cls.authors = [
+            User.objects.create_user(username=f'feed{i}',
+                                     email=f'feed{i}@test.ru')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            create_recipes(4, author, [], [])
+        create_recipes(2, cls.reader, [], [])
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def test_feed_pages(self):
+        """Только рецепты подписок, по страницам в порядке ленты."""
+        expected = list(Recipe.objects.filter(
+            author__in=self.authors[:2]
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+        ids, url = [], '/api/recipes/feed/?limit=3'
+        while url:
+            with self.assertNumQueries(LIST_QUERIES_WITHOUT_COUNT):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+        recipe = response.data['results'][0]
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(
+            set(recipe),
+            set(self.client.get(f'/api/recipes/{recipe["id"]}/').data))
+
+    def test_follow_changes_etag(self):
+        """Новая подписка меняет ETag ленты."""
+        with self.captureOnCommitCallbacks(execute=True):
+            etag = self.client.get('/api/recipes/feed/')['ETag']
+        response = self.client.get('/api/recipes/feed/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.reader, author=self.authors[2])
+        response = self.client.get('/api/recipes/feed/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_anonymous(self):
+        """Лента доступна только авторизованным."""
+        response = APIClient().get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class SubscriptionsTestCase(TestCase):
+    """Список подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='follower', email='follower@test.ru')
+        for number in range(4):
+            author = User.objects.create_user(
+                username=f'followed{number}',
+                email=f'followed{number}@test.ru')
+            create_recipes(number + 1, author, [], [])
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_query_count_is_constant(self):
+        """Страница подписок: count, подписки с авторами, рецепты."""
+        for limit in (2, 6):
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    '/api/users/subscriptions/',
+                    {'limit': limit, 'recipes_limit': 2})
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = response.data['results']
+        self.assertEqual([item['recipes_count'] for item in results],
+                         [1, 2, 3, 4])
+        self.assertEqual([len(item['recipes']) for item in results],
+                         [1, 2, 2, 2])
+        self.assertTrue(all(item['is_subscribed'] for item in results))
+        latest = Recipe.objects.filter(
+            author_id=results[-1]['id']).values_list('id', flat=True)[:2]
+        self.assertEqual([recipe['id'] for recipe in results[-1]['recipes']],
+                         list(latest))
+
+    def test_without_recipes_limit(self):
+        """Без recipes_limit возвращаются все рецепты автора."""
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(
+            [len(item['recipes']) for item in response.data['results']],
+            [1, 2, 3, 4])
+
+    def test_without_follows(self):
+        """Пользователь без подписок получает пустой список."""
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(
+            username='lonely', email='lonely@test.ru'))
+        for params in ({}, {'recipes_limit': 2}):
+            response = client.get('/api/users/subscriptions/', params)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(response.data['results'], [])
+        self.assertEqual(list(Recipe.objects.latest_by_author([], 2)), [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UserRelationsTestCase(TestCase):
+    """Флаги связей пользователя из кэша запроса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='relations',
+                                              email='relations@test.ru')
+        cls.authors = [
+            User.objects.create_user(username=f'related{i}',
+                                     email=f'related{i}@test.ru')
+            for i in range(4)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.authors[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def users(self, limit):
+        """Список пользователей и число выполненных запросов."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(f'/api/users/?limit={limit}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.data['results'], len(captured)
+
+    def test_users_list_queries(self):
+        """Подписки загружаются один раз на страницу пользователей."""
+        few, few_queries = self.users(2)
+        many, many_queries = self.users(5)
+        self.assertEqual(few_queries, many_queries)
+        subscribed = {user['id'] for user in many if user['is_subscribed']}
+        self.assertEqual(subscribed, {self.authors[0].id})
+
+    def test_recipe_create_flags(self):
+        """Флаги созданного рецепта и его автора."""
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        client = APIClient()
+        client.force_authenticate(user=self.authors[0])
+        response = client.post('/api/recipes/', {
+            'name': 'Свой', 'text': 'Текст', 'cooking_time': 5,
+            'image': make_image(), 'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertFalse(response.data['is_in_shopping_cart'])
+        self.assertFalse(response.data['author']['is_subscribed'])
+        Favourite.objects.create(author=self.reader,
+                                 recipe_id=response.data['id'])
+        recipe = self.client.get(f'/api/recipes/{response.data["id"]}/')
+        self.assertTrue(recipe.data['is_favorited'])
+        self.assertTrue(recipe.data['author']['is_subscribed'])
+
+
+@override_settings(AUTH_TOKEN_MODE='signed')
+class SignedTokenTestCase(TestCase):
+    """Подписанные токены входа."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='signed', email='signed@test.ru', password='Secret-123')
+
+    def login(self, password='Secret-123'):
+        """Вход через djoser и клиент с полученным токеном."""
+        response = APIClient().post('/api/auth/token/login/', {
+            'email': self.user.email, 'password': password})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}')
+        return client
+
+    def test_no_token_lookup(self):
+        """Токен проверяется без запроса к таблице токенов."""
+        client = self.login()
+        forced = APIClient()
+        forced.force_authenticate(user=self.user)
+        client.get('/api/users/subscriptions/')
+        with CaptureQueriesContext(connection) as signed:
+            response = client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        with CaptureQueriesContext(connection) as baseline:
+            forced.get('/api/users/subscriptions/')
+        self.assertEqual(len(signed), len(baseline))
+        self.assertFalse(any('authtoken_token' in query['sql']
+                             for query in signed.captured_queries))
+        me = client.get('/api/users/me/').data
+        self.assertEqual((me['id'], me['email'], me['first_name']),
+                         (self.user.id, self.user.email,
+                          self.user.first_name))
+
+    def test_logout_revokes_token(self):
+        """После выхода токен не принимается, другие токены работают."""
+        client, other = self.login(), self.login()
+        response = client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.assertEqual(other.get('/api/users/me/').status_code,
+                         HTTPStatus.OK)
+
+    def test_set_password_revokes_tokens(self):
+        """Смена пароля отзывает все выданные ранее токены."""
+        client = self.login()
+        response = client.post('/api/users/set_password/', {
+            'current_password': 'Secret-123',
+            'new_password': 'Changed-456'})
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        client = self.login('Changed-456')
+        self.assertEqual(client.get('/api/users/me/').status_code,
+                         HTTPStatus.OK)
+
+    def test_revocation_reaches_other_workers(self):
+        """Воркер с общим кэшем видит отзыв сразу, не дожидаясь TTL."""
+        response = APIClient().post('/api/auth/token/login/', {
+            'email': self.user.email, 'password': 'Secret-123'})
+        key = response.data['auth_token']
+        payload = AccessToken(key).payload
+        worker = RevocationList()
+        self.assertFalse(worker.is_revoked(payload))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/auth/token/logout/')
+        self.assertTrue(worker.is_revoked(payload))
+
+    def test_invalid_token(self):
+        """Испорченный токен отклоняется."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token a.b.c')
+        response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_MODE='db')
+    def test_db_mode(self):
+        """В режиме db выдаётся токен из таблицы, как раньше."""
+        client = self.login()
+        self.assertEqual(client.get('/api/users/me/').status_code,
+                         HTTPStatus.OK)
+        self.assertTrue(Token.objects.filter(user=self.user).exists())
+        client.post('/api/auth/token/logout/')
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+
+class RecipeResponseCacheTestCase(TestCase):
+    """Кэш ответов рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cached', email='cached@test.ru')
+        cls.author = User.objects.create_user(
+            username='chef', email='chef@test.ru', first_name='Шеф')
+        cls.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        cls.recipe, cls.other = create_recipes(2, cls.author, [cls.tag], [])
+        Favourite.objects.create(author=cls.user, recipe=cls.recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=self.user)
+
+    def test_anonymous_hit_does_not_touch_db(self):
+        """Повторный анонимный запрос отдаётся из кэша.
+
+        Остаётся только чтение счётчиков изменений для ETag.
+        """
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            first = self.client.get(url)
+            with self.assertNumQueries(1):
+                second = self.client.get(url)
+            self.assertEqual(first.json(), second.json())
+
+    def test_authenticated_hit_merges_flags(self):
+        """Авторизованный пользователь получает свои флаги."""
+        self.client.get('/api/recipes/')
+        with self.assertNumQueries(4):
+            response = self.auth_client.get('/api/recipes/')
+        flags = {recipe['id']: recipe['is_favorited']
+                 for recipe in response.data['results']}
+        self.assertEqual(flags, {self.recipe.pk: True, self.other.pk: False})
+        self.assertTrue(all(recipe['author']['is_subscribed']
+                            for recipe in response.data['results']))
+        anonymous = self.client.get('/api/recipes/').json()
+        self.assertFalse(any(recipe['is_favorited']
+                             for recipe in anonymous['results']))
+
+    def test_invalidation(self):
+        """Изменения рецепта, тега и автора сбрасывают кэш."""
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.get(pk=self.recipe.pk)
+            recipe.name = 'Новое имя'
+            recipe.save()
+        self.assertEqual(self.client.get(url).json()['name'], 'Новое имя')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Поздний ужин'
+            self.tag.save()
+        self.assertEqual(self.client.get(url).json()['tags'][0]['name'],
+                         'Поздний ужин')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Повар'
+            self.author.save()
+        results = self.client.get('/api/recipes/').json()['results']
+        self.assertTrue(all(recipe['author']['first_name'] == 'Повар'
+                            for recipe in results))
+
+    def test_version_comes_from_db_counter(self):
+        """Запись в другом воркере: меняется только счётчик в БД."""
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        self.client.get('/api/recipes/')
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Из воркера')
+        bump_counters(RECIPES)
+        self.assertEqual(self.client.get(url).json()['name'], 'Из воркера')
+        names = [recipe['name'] for recipe
+                 in self.client.get('/api/recipes/').json()['results']]
+        self.assertIn('Из воркера', names)
+
+
+class ConditionalGetTestCase(TestCase):
+    """Условные запросы по ETag и Last-Modified."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='etag', email='etag@test.ru')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        cls.recipe, = create_recipes(1, cls.user, [cls.tag], [cls.salt])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def assert_revalidates(self, url, change):
+        """Ответ 304 до изменения и 200 после него."""
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tags(self):
+        """Теги."""
+        self.assert_revalidates(
+            '/api/tags/',
+            lambda: Tag.objects.create(name='Ужин', slug='dinner'))
+
+    def test_ingredients(self):
+        """Каталог ингредиентов."""
+        self.assert_revalidates(
+            '/api/ingredients/',
+            lambda: Ingredient.objects.create(name='Перец',
+                                              measurement_unit='г'))
+
+    def test_recipes_personal_flags(self):
+        """Флаги пользователя входят в валидатор рецептов."""
+        self.assert_revalidates(
+            f'/api/recipes/{self.recipe.pk}/',
+            lambda: Favourite.objects.create(author=self.user,
+                                             recipe=self.recipe))
+
+    def test_recipes_after_ingredient_rename(self):
+        """Переименование ингредиента меняет ETag рецептов с ним."""
+        def rename():
+            self.salt.name = 'Соль морская'
+            self.salt.save()
+
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assert_revalidates(url, rename)
+        ingredients = self.client.get(url).data['ingredients']
+        self.assertEqual(ingredients[0]['name'], 'Соль морская')
+
+    def test_if_modified_since(self):
+        """Last-Modified проверяется через If-Modified-Since."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.save()
+        last_modified = self.client.get('/api/tags/')['Last-Modified']
+        response = self.client.get('/api/tags/',
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+
+class QueryTimingMiddlewareTestCase(TestCase):
+    """Учёт SQL-запросов и времени ответа."""
+
+    def test_server_timing_header(self):
+        """В ответе есть заголовок Server-Timing с числом запросов.
+
+        Список тегов: счётчики изменений и сами теги.
+        """
+        response = self.client.get('/api/tags/')
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_log(self):
+        """Медленный запрос пишется в лог одной JSON-строкой."""
+        with self.assertLogs('api.timing', level='WARNING') as logs:
+            self.client.get('/api/tags/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/api/tags/')
+        self.assertEqual(record['queries'], 2)
+        self.assertEqual(record['duplicate_queries'], 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageVariantsTestCase(TestCase):
+    """Фоновое создание вариантов изображений."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='painter', email='painter@test.ru')
+        cls.tag = Tag.objects.create(name='Десерт', slug='dessert')
+        cls.ingredient = Ingredient.objects.create(
+            name='Сахар', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def large_image(self):
+        """Картинка 1600x1000 в base64."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1000), 'red').save(buffer, format='JPEG')
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f'data:image/jpeg;base64,{encoded}'
+
+    def process(self):
+        """Запускает воркер до опустошения очереди."""
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_images', '--once', stdout=io.StringIO())
+
+    def test_recipe_variants(self):
+        """Варианты создаются воркером и отдаются в API."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Торт',
+                'text': 'Текст',
+                'cooking_time': 60,
+                'image': self.large_image(),
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data['image_variants'], {})
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertTrue(ImageJob.objects.filter(
+            object_id=recipe.pk).exists())
+
+        self.process()
+        self.assertFalse(ImageJob.objects.exists())
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.image_variants['width'], recipe.image_variants['height']),
+            (1600, 1000))
+        variants = self.client.get(
+            f'/api/recipes/{recipe.pk}/').data['image_variants']
+        self.assertEqual(variants.keys(), RECIPE_IMAGE_VARIANTS.keys())
+        for name, (width, height, _) in RECIPE_IMAGE_VARIANTS.items():
+            self.assertLessEqual(variants[name]['width'], width)
+            self.assertLessEqual(variants[name]['height'], height)
+            stored = recipe.image_variants['variants'][name]['name']
+            self.assertTrue(variants[name]['url'].endswith(stored))
+            self.assertTrue(default_storage.exists(stored))
+
+    def test_avatar_variants_and_removal(self):
+        """Аватар уменьшается, после удаления файлы убирает gc_media."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/api/users/me/avatar/',
+                            {'avatar': self.large_image()}, format='json')
+        self.process()
+        self.user.refresh_from_db()
+        variants = self.client.get('/api/users/me/').data['avatar_variants']
+        self.assertEqual(
+            (variants['avatar']['width'], variants['avatar']['height']),
+            (160, 160))
+        stored = self.user.avatar_variants['variants']['avatar']['name']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/users/me/avatar/')
+        self.process()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_variants, {})
+        self.assertTrue(default_storage.exists(stored))
+        call_command('gc_media', min_age=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(stored))
+
+    def test_deduplication_and_gc(self):
+        """Одинаковые файлы хранятся один раз и удаляются без ссылок."""
+        image = self.large_image()
+        names = []
+        for title in ('Первый', 'Второй'):
+            response = self.client.post('/api/recipes/', {
+                'name': title, 'text': 'Текст', 'cooking_time': 5,
+                'image': image, 'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            }, format='json')
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            names.append(Recipe.objects.get(pk=response.data['id']).image.name)
+        self.assertEqual(names[0], names[1])
+        self.assertRegex(names[0], r'^recipes/images/[0-9a-f]{2}/[0-9a-f]{64}'
+                                   r'\.jpe?g$')
+        orphan = default_storage.save('recipes/images/old.png',
+                                      io.BytesIO(b'orphan'))
+
+        out = io.StringIO()
+        call_command('gc_media', min_age=0, dry_run=True, stdout=out)
+        self.assertIn(orphan, out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(orphan))
+
+        Recipe.objects.filter(name='Первый').delete()
+        call_command('gc_media', min_age=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(names[0]))
+        Recipe.objects.all().delete()
+        call_command('gc_media', min_age=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(names[0]))
+
+    def test_backfill(self):
+        """Команда ставит в очередь изображения без вариантов."""
+        recipe, = create_recipes(1, self.user, [self.tag], [])
+        ImageJob.objects.all().delete()
+        call_command('backfill_image_variants', stdout=io.StringIO())
+        self.assertEqual(
+            list(ImageJob.objects.values_list('object_id', flat=True)),
+            [recipe.pk])
+        # Файла нет: задача не удаляется, ошибка сохраняется.
+        with self.assertLogs('api.images', 'ERROR'):
+            call_command('process_images', '--once', stdout=io.StringIO())
+        job = ImageJob.objects.get()
+        self.assertEqual(job.attempts, 3)
+        self.assertTrue(job.error)
+
+
+class FavouriteToggleTestCase(TestCase):
+    """Добавление и удаление в избранное и список покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='fan', email='fan@test.ru')
+        cls.tag = Tag.objects.create(name='Суп', slug='soup')
+        cls.recipes = create_recipes(3, cls.user, [cls.tag], [])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def one_query(self):
+        """Один запрос на PostgreSQL, на других СУБД число не проверяется."""
+        if connection.vendor == 'postgresql':
+            return self.assertNumQueries(1)
+        return nullcontext()
+
+    def test_single_toggle_is_one_query(self):
+        """Каждое действие выполняется одним запросом."""
+        for action, model in (('favorite', Favourite),
+                              ('shopping_cart', ShoppingCart)):
+            url = f'/api/recipes/{self.recipes[0].pk}/{action}/'
+            with self.one_query():
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            self.assertEqual(response.data['id'], self.recipes[0].pk)
+            self.assertEqual(response.data['name'], self.recipes[0].name)
+            with self.one_query():
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            with self.one_query():
+                response = self.client.delete(url)
+            self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+            self.assertFalse(model.objects.exists())
+            response = self.client.delete(url)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            for method in (self.client.post, self.client.delete):
+                response = method(f'/api/recipes/0/{action}/')
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_toggle_bumps_user_counter(self):
+        """Изменение списка меняет ETag персональных ответов."""
+        etag = self.client.get('/api/recipes/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{self.recipes[0].pk}/favorite/')
+        self.assertNotEqual(self.client.get('/api/recipes/')['ETag'], etag)
+
+    def test_bulk(self):
+        """Пакетные операции идемпотентны."""
+        ids = [recipe.pk for recipe in self.recipes[:2]]
+        response = self.client.post('/api/recipes/shopping_cart/',
+                                    {'recipes': ids + [0]}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        missing = self.recipes[-1].pk + 1
+        with self.one_query():
+            response = self.client.post('/api/recipes/shopping_cart/',
+                                        {'recipes': ids + [missing]},
+                                        format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual([recipe['id'] for recipe in response.data['added']],
+                         ids)
+        self.assertEqual(response.data['not_found'], [missing])
+        response = self.client.post(
+            '/api/recipes/shopping_cart/',
+            {'recipes': [recipe.pk for recipe in self.recipes]},
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data['existing'], ids)
+        self.assertEqual(ShoppingCart.objects.count(), 3)
+
+        with self.one_query():
+            response = self.client.delete('/api/recipes/shopping_cart/',
+                                          {'recipes': ids}, format='json')
+        self.assertEqual(response.data['removed'], ids)
+        response = self.client.delete('/api/recipes/shopping_cart/',
+                                      {'recipes': ids}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['not_found'], ids)
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+
+
+class CountersTestCase(TestCase):
+    """Денормализованные счётчики избранного и рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='counted', email='counted@test.ru')
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru')
+        cls.tag = Tag.objects.create(name='Каша', slug='porridge')
+        cls.recipes = create_recipes(3, cls.author, [cls.tag], [])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def favorites_counts(self):
+        """Счётчики избранного рецептов по порядку создания."""
+        return list(Recipe.objects.order_by('id').values_list(
+            'favorites_count', flat=True))
+
+    def test_favorites_count(self):
+        """Все пути записи избранного обновляют счётчик."""
+        first, second, third = self.recipes
+        self.client.post(f'/api/recipes/{first.pk}/favorite/')
+        self.client.post('/api/recipes/favorite/',
+                         {'recipes': [first.pk, second.pk]}, format='json')
+        Favourite.objects.create(author=self.author, recipe=second)
+        self.assertEqual(self.favorites_counts(), [1, 2, 0])
+
+        self.client.delete('/api/recipes/favorite/',
+                           {'recipes': [first.pk, second.pk]}, format='json')
+        Favourite.objects.filter(recipe=second).delete()
+        self.assertEqual(self.favorites_counts(), [0, 0, 0])
+
+    def test_recipes_count(self):
+        """Создание и удаление рецептов меняют счётчик автора."""
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+        self.recipes[0].delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.data['results'][0]['recipes_count'], 2)
+
+    def test_recount(self):
+        """Команда исправляет расхождения."""
+        Favourite.objects.create(author=self.reader, recipe=self.recipes[2])
+        Recipe.objects.update(favorites_count=7)
+        User.objects.update(recipes_count=0)
+        out = io.StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('рецептов: 3, пользователей: 1', out.getvalue())
+        self.assertEqual(self.favorites_counts(), [0, 0, 1])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+
+    def test_popular_ordering(self):
+        """Сортировка по популярности следует за избранным."""
+        first, second, third = self.recipes
+        self.client.post('/api/recipes/favorite/',
+                         {'recipes': [first.pk, second.pk]}, format='json')
+        Favourite.objects.create(author=self.author, recipe=second)
+        url = '/api/recipes/?ordering=popular'
+        response = self.client.get(url)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [second.pk, first.pk, third.pk])
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Favourite.objects.create(author=self.author, recipe=third)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['results'][0]['id'], second.pk)
+
+
+class RecipeFilterTestCase(TestCase):
+    """Фильтры рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='filter', email='filter@test.ru')
+        cls.breakfast = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.dinner = Tag.objects.create(name='Ужин', slug='dinner')
+        cls.both, = create_recipes(
+            1, cls.user, [cls.breakfast, cls.dinner], [])
+        cls.other = Recipe.objects.create(
+            name='Без тегов', author=cls.user, image='recipes/images/x.png',
+            text='Текст', cooking_time=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def ids(self, url):
+        """Id рецептов ответа."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_tags_without_duplicates_or_lookups(self):
+        """Рецепт с несколькими тегами не дублируется, слаги не читаются."""
+        url = '/api/recipes/?tags=breakfast&tags=dinner'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as unfiltered:
+            self.client.get('/api/recipes/')
+        with CaptureQueriesContext(connection) as filtered:
+            self.assertEqual(self.ids(url), [self.both.pk])
+        self.assertEqual(len(filtered), len(unfiltered))
+        self.assertFalse(any('DISTINCT' in query['sql']
+                             for query in filtered.captured_queries))
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_new_tag_is_accepted(self):
+        """Новый тег виден фильтру после сброса словаря."""
+        with self.captureOnCommitCallbacks(execute=True):
+            lunch = Tag.objects.create(name='Обед', slug='lunch')
+            self.other.tags.add(lunch)
+        self.assertEqual(self.ids('/api/recipes/?tags=lunch'),
+                         [self.other.pk])
+
+    def test_tag_from_other_worker_is_accepted(self):
+        """Тег, о котором словарь процесса не знает, проверяется по БД."""
+        self.client.get('/api/recipes/?tags=breakfast')
+        # Сигнал сработал бы в другом воркере: версия в кэше прежняя.
+        lunch = Tag.objects.create(name='Обед', slug='lunch')
+        self.other.tags.add(lunch)
+        self.assertEqual(self.ids('/api/recipes/?tags=lunch&tags=dinner'),
+                         [self.other.pk, self.both.pk])
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_author_and_user_lists(self):
+        """Фильтр автора по id и фильтры списков пользователя."""
+        self.assertEqual(self.ids(f'/api/recipes/?author={self.user.pk}'),
+                         [self.other.pk, self.both.pk])
+        self.assertEqual(self.ids(f'/api/recipes/?author={self.user.pk + 1}'),
+                         [])
+        Favourite.objects.create(author=self.user, recipe=self.both)
+        ShoppingCart.objects.create(author=self.user, recipe=self.other)
+        self.assertEqual(self.ids('/api/recipes/?is_favorited=1'),
+                         [self.both.pk])
+        self.assertEqual(
+            self.ids('/api/recipes/?is_in_shopping_cart=1&tags=dinner'), [])
+
+
+class RecipeSearchTestCase(TestCase):
+    """Полнотекстовый поиск рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='searcher', email='searcher@test.ru')
+        cls.soup = Tag.objects.create(name='Суп', slug='soup')
+        cls.beet = Ingredient.objects.create(
+            name='Свёкла', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def create(self, name, text, tags=(), ingredients=()):
+        """Рецепт с обновлением индекса после фиксации."""
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name=name, author=self.user, text=text, cooking_time=5,
+                image='recipes/images/test.png')
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredients=ingredient,
+                                 amount=1)
+                for ingredient in ingredients
+            )
+        return recipe
+
+    def search(self, query, **params):
+        """Id найденных рецептов."""
+        response = self.client.get('/api/recipes/',
+                                   {'search': query, **params})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_stemming_and_ranking(self):
+        """Словоформы находятся, совпадение в названии выше."""
+        in_text = self.create('Обед', 'Подать к борщу сметану')
+        in_name = self.create('Борщ украинский', 'Сварить')
+        self.create('Омлет', 'Взбить яйца')
+        self.assertEqual(self.search('борща'), [in_name.pk, in_text.pk])
+
+    def test_ingredients_filters_and_pagination(self):
+        """Поиск по ингредиентам вместе с фильтрами и пагинацией."""
+        with_tag = self.create('Холодник', 'Летний', [self.soup], [self.beet])
+        self.create('Винегрет', 'Салат', [], [self.beet])
+        self.assertEqual(len(self.search('свёкла')), 2)
+        self.assertEqual(self.search('свёкла', tags='soup'), [with_tag.pk])
+        response = self.client.get('/api/recipes/',
+                                   {'search': 'свёкла', 'limit': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 1)
+        # Курсор сортирует по дате и потерял бы порядок релевантности.
+        cursor = self.client.get('/api/recipes/', {
+            'search': 'свёкла', 'pagination': 'cursor', 'limit': 1})
+        self.assertEqual(cursor.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении рецепта и ингредиента."""
+        recipe = self.create('Пирог', 'Испечь', [], [self.beet])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Запеканка'
+            recipe.save()
+        self.assertEqual(self.search('пирог'), [])
+        self.assertEqual(self.search('запеканка'), [recipe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beet.name = 'Буряк'
+            self.beet.save()
+        self.assertEqual(self.search('буряк'), [recipe.pk])
+
+
+class RecipeTransferTestCase(TestCase):
+    """Выгрузка и загрузка рецептов в NDJSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='keeper', email='keeper@test.ru', is_staff=True)
+        cls.author = User.objects.create_user(
+            username='porter', email='porter@test.ru')
+        cls.tags = [Tag.objects.create(name='Ужин', slug='dinner'),
+                    Tag.objects.create(name='Суп', slug='soup')]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Груз {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        create_recipes(3, cls.author, cls.tags, cls.ingredients[:2])
+        create_recipes(2, cls.admin, cls.tags[:1], cls.ingredients[2:])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def export(self):
+        """Выгрузка через API."""
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return b''.join(response.streaming_content)
+
+    def snapshot(self):
+        """Рецепты с составом в сравнимом виде."""
+        return sorted(
+            (recipe.name, recipe.author_id, recipe.pub_date,
+             tuple(sorted(recipe.tags.values_list('slug', flat=True))),
+             tuple(sorted(recipe.recipe_ingredients.values_list(
+                 'ingredients__name', 'amount'))))
+            for recipe in Recipe.objects.all())
+
+    def post(self, body, client=None):
+        """Загрузка через API."""
+        return (client or self.client).post(
+            '/api/recipes/import/', body,
+            content_type='application/x-ndjson')
+
+    def test_round_trip(self):
+        """Выгрузка, удаление и загрузка восстанавливают рецепты."""
+        body = self.export()
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[0]['author'], self.author.email)
+        self.assertEqual(len(records[0]['ingredients']), 2)
+        expected = self.snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(body)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data, {'created': 5, 'skipped': 0,
+                                         'ingredients': 0})
+        self.assertEqual(self.snapshot(), expected)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+        self.assertEqual(ImageJob.objects.count(), 5)
+
+        response = self.post(body)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['skipped'], 5)
+
+    def test_command_creates_missing_ingredients(self):
+        """Команды переносят рецепты, недостающие ингредиенты создаются."""
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/recipes.ndjson'
+            call_command('export_recipes', path, chunk_size=2)
+            Recipe.objects.all().delete()
+            Ingredient.objects.filter(pk=self.ingredients[2].pk).delete()
+            call_command('import_recipes', path, batch_size=2, stdout=out)
+        self.assertIn('Создано рецептов: 5', out.getvalue())
+        self.assertIn('новых ингредиентов: 1', out.getvalue())
+        self.assertEqual(Recipe.objects.filter(
+            ingredients__name='Груз 2').count(), 2)
+
+    def test_new_ingredients_reset_index_and_etag(self):
+        """Созданные импортом ингредиенты видны списку и автодополнению."""
+        self.client.get('/api/ingredients/', {'name': 'Шаф'})
+        etag = self.client.get('/api/ingredients/')['ETag']
+        ingredient = {'name': 'Шафран', 'measurement_unit': 'г', 'amount': 1}
+        record = {'name': 'Плов', 'text': 'Текст', 'cooking_time': 30,
+                  'author': self.author.email, 'tags': [],
+                  'ingredients': [ingredient]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(json.dumps(record, ensure_ascii=False))
+        self.assertEqual(response.data['ingredients'], 1)
+
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get('/api/ingredients/', {'name': 'Шаф'})
+        self.assertEqual([item['name'] for item in response.data],
+                         ['Шафран'])
+
+    def test_duplicate_names_are_skipped(self):
+        """Повторы пары автор и название пропускаются, а не дают 500."""
+        existing = Recipe.objects.filter(author=self.author).first()
+        record = {'name': existing.name, 'text': 'Текст', 'cooking_time': 5,
+                  'author': self.author.email, 'tags': [], 'ingredients': []}
+        response = self.post(json.dumps(record, ensure_ascii=False))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['skipped'], 1)
+        response = self.post(json.dumps(
+            {**record, 'pub_date': '2020-01-01T00:00:00+00:00'},
+            ensure_ascii=False))
+        self.assertEqual(response.data['skipped'], 1)
+
+        line = json.dumps({**record, 'name': 'Дважды'}, ensure_ascii=False)
+        response = self.post(f'{line}\n{line}\n'.encode())
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual((response.data['created'], response.data['skipped']),
+                         (1, 1))
+        self.assertEqual(Recipe.objects.filter(name='Дважды').count(), 1)
+
+    def test_errors(self):
+        """Загрузка только для администраторов, ошибки строк - 400."""
+        client = APIClient()
+        client.force_authenticate(user=self.author)
+        self.assertEqual(client.get('/api/recipes/export/').status_code,
+                         HTTPStatus.FORBIDDEN)
+        self.assertEqual(self.post(b'{}', client).status_code,
+                         HTTPStatus.FORBIDDEN)
+        response = self.post(b'{"name": "x"}\n')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('Строка 1', response.data['errors'])
+
+
+class AdminScaleTestCase(TestCase):
+    """Админ-зона не загружает связанные таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='root', email='root@test.ru', password='x')
+        cls.users = User.objects.bulk_create(
+            User(username=f'crowd{i}', email=f'crowd{i}@test.ru')
+            for i in range(30))
+        cls.users = list(User.objects.filter(
+            email__startswith='crowd').order_by('id'))
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        cls.recipes = create_recipes(3, cls.users[-1], [],
+                                     [cls.ingredient])
+        for user in cls.users[:3]:
+            Favourite.objects.create(author=user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        """Списки открываются, варианты фильтра идут по страницам."""
+        for url in ('recipe/recipe', 'recipe/favourite',
+                    'recipe/shoppingcart', 'recipe/recipeingredient',
+                    'recipe/follow', 'recipe/ingredient', 'user/customuser'):
+            response = self.client.get(f'/admin/{url}/')
+            self.assertEqual(response.status_code, HTTPStatus.OK, url)
+        response = self.client.get('/admin/recipe/recipe/')
+        authors = response.context['cl'].filter_specs[1]
+        self.assertEqual(len(authors.lookup_choices), 20)
+        self.assertTrue(authors.has_next)
+        self.assertNotIn(self.users[-1].id,
+                         [pk for pk, _ in authors.lookup_choices])
+
+        author = self.users[-1]
+        response = self.client.get('/admin/recipe/recipe/', {
+            'author__id__exact': author.id, 'author__page': 1})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        authors = response.context['cl'].filter_specs[1]
+        self.assertIn(author.id, [pk for pk, _ in authors.lookup_choices])
+
+    def test_recipe_form(self):
+        """Форма рецепта без списков всех ингредиентов и пользователей."""
+        response = self.client.get(
+            f'/admin/recipe/recipe/{self.recipes[0].id}/change/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotContains(response, self.users[0].username)
+        self.assertContains(response, 'admin-autocomplete')
+
+
+THROTTLE_SETTINGS = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    'shopping_cart': '4/min',
+    'shopping_cart.total': '6/min',
+    'recipe_write': '100/min',
+    'recipe_write.total': None,
+}}
+
+
+@override_settings(REST_FRAMEWORK=THROTTLE_SETTINGS, THROTTLE_ENABLED=True)
+class ThrottleTestCase(TestCase):
+    """Лимиты дорогих действий по корзинам токенов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(
+            username=f'throttled{number}', email=f'throttled{number}@test.ru'
+        ) for number in range(3)]
+        cls.admin = User.objects.create_user(
+            username='throttle_admin', email='throttle_admin@test.ru',
+            is_staff=True)
+
+    def setUp(self):
+        for store in STORES.values():
+            store.clear()
+        cache.clear()
+
+    def download(self, user):
+        """Скачивание списка покупок от имени пользователя."""
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get('/api/recipes/download_shopping_cart/')
+
+    def stats(self):
+        """Счётчики лимитов из /api/throttles/."""
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        response = client.get('/api/throttles/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.data['scopes']
+
+    def assert_limits(self):
+        """Корзина пользователя, затем общая корзина действия."""
+        first, second, third = self.users
+        for _ in range(2):
+            self.assertEqual(self.download(first).status_code,
+                             HTTPStatus.OK)
+        with self.assertLogs('api.throttling') as logs:
+            response = self.download(first)
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        # Два токена при пополнении 4 в минуту набираются за 30 секунд.
+        self.assertIn(int(response['Retry-After']), range(29, 31))
+        self.assertEqual(json.loads(logs.records[0].getMessage())['limit'],
+                         'user')
+
+        self.assertEqual(self.download(second).status_code, HTTPStatus.OK)
+        with self.assertLogs('api.throttling') as logs:
+            response = self.download(third)
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertIn(int(response['Retry-After']), range(19, 21))
+        self.assertEqual(json.loads(logs.records[0].getMessage())['limit'],
+                         'total')
+
+        stats = self.stats()['shopping_cart']
+        self.assertEqual(stats['rate'], '4/min')
+        self.assertEqual(stats['total_rate'], '6/min')
+        self.assertEqual((stats['allowed'], stats['throttled_user'],
+                          stats['throttled_total']), (3, 1, 1))
+
+    def test_local_buckets(self):
+        """Корзины в памяти процесса."""
+        self.assert_limits()
+
+    @override_settings(THROTTLE_STORAGE='cache')
+    def test_cache_buckets(self):
+        """Корзины в кэше Django."""
+        self.assert_limits()
+
+    def test_cheap_actions_and_disabled(self):
+        """Чтение не ограничивается, лимит отключается настройкой."""
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        for _ in range(5):
+            self.assertEqual(client.get('/api/recipes/').status_code,
+                             HTTPStatus.OK)
+        with override_settings(THROTTLE_ENABLED=False):
+            for _ in range(5):
+                self.assertEqual(self.download(self.users[0]).status_code,
+                                 HTTPStatus.OK)
+        self.assertEqual(self.stats()['shopping_cart']['allowed'], 0)
+
+    @override_settings(CACHE_LOCATION='/tmp/throttle-stats')
+    def test_shared_counters_with_local_buckets(self):
+        """При общем кэше счётчики пишутся в него и для local."""
+        self.assertEqual(self.download(self.users[0]).status_code,
+                         HTTPStatus.OK)
+        self.assertEqual(STORES['local'].stats(
+            [('shopping_cart', 'allowed')]), {('shopping_cart', 'allowed'): 0})
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        data = client.get('/api/throttles/').data
+        self.assertEqual(data['counters'], 'shared')
+        self.assertEqual(data['scopes']['shopping_cart']['allowed'], 1)
+
+    def test_stats_for_admins_only(self):
+        """Счётчики доступны только администраторам."""
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        self.assertEqual(client.get('/api/throttles/').status_code,
+                         HTTPStatus.FORBIDDEN)
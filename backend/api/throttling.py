@@ -0,0 +1,255 @@
+"""Ограничение дорогих запросов корзинами токенов.
+
+Представление описывает дорогие действия атрибутом throttle_costs:
+{действие: (группа, стоимость в токенах)}. На каждый запрос списываются
+токены из двух корзин группы: корзины пользователя (анонимов - по IP)
+и общей корзины действия для всех клиентов. Скорости задаются
+в DEFAULT_THROTTLE_RATES строками «N/период»: «группа» для пользователя,
+«группа.total» для общей корзины; N - вместимость корзины, за период
+она наполняется заново.
+
+Корзины хранятся в памяти процесса (THROTTLE_STORAGE=local, у каждого
+воркера свои) или в кэше Django (cache, с CACHE_LOCATION общий для
+воркеров сервера). Счётчики пропущенных и отклонённых запросов
+по группам отдаёт /api/throttles/; при общем кэше они пишутся в него
+и при корзинах в памяти процесса.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .constants import THROTTLE_LOCAL_MAX_BUCKETS
+
+logger = logging.getLogger('api.throttling')
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+TOTAL = '{}.total'
+BUCKET_KEY = 'throttle:{}'
+STATS_KEY = 'throttle_stats:{}:{}'
+STATS = ('allowed', 'throttled_user', 'throttled_total')
+
+
+def parse_rate(rate):
+    """Вместимость корзины и пополнение в секунду из «N/период».
+
+    Пустая скорость означает отсутствие лимита.
+    """
+    if not rate:
+        return None
+    number, period = rate.split('/')
+    number = int(number)
+    return number, number / PERIODS[period[0]]
+
+
+def refill(state, capacity, rate, now):
+    """Число токенов корзины к моменту now."""
+    if state is None:
+        return capacity
+    tokens, updated, _ = state
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def take(states, buckets, now):
+    """Списывает токены из всех корзин сразу или ни из одной.
+
+    buckets - список (ключ, вместимость, пополнение, стоимость).
+    Возвращает новые состояния (токены, время, срок до наполнения)
+    и None либо ключ корзины, которой не хватило токенов, и время
+    ожидания в секундах.
+    """
+    tokens = {key: refill(states.get(key), capacity, rate, now)
+              for key, capacity, rate, _ in buckets}
+    waits = {key: (cost - tokens[key]) / rate
+             for key, _, rate, cost in buckets if tokens[key] < cost}
+    if waits:
+        key = max(waits, key=waits.get)
+        return {}, key, waits[key]
+    new_states = {}
+    for key, capacity, rate, cost in buckets:
+        left = tokens[key] - cost
+        new_states[key] = (left, now, now + (capacity - left) / rate)
+    return new_states, None, 0.0
+
+
+class LocalStore:
+    """Корзины в памяти процесса, свои у каждого воркера."""
+
+    def __init__(self):
+        """Пустое хранилище."""
+        self._buckets = {}
+        self._stats = Counter()
+        self._lock = threading.Lock()
+
+    def consume(self, buckets, now):
+        """Списание токенов под блокировкой процесса."""
+        with self._lock:
+            states, key, wait = take(self._buckets, buckets, now)
+            self._buckets.update(states)
+            if len(self._buckets) > THROTTLE_LOCAL_MAX_BUCKETS:
+                # Полные корзины не отличаются от отсутствующих.
+                self._buckets = {
+                    bucket: state for bucket, state in self._buckets.items()
+                    if state[2] > now}
+            return key, wait
+
+    def count(self, name):
+        """Увеличивает счётчик."""
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self, names):
+        """Значения счётчиков."""
+        with self._lock:
+            return {name: self._stats[name] for name in names}
+
+    def clear(self):
+        """Сбрасывает корзины и счётчики."""
+        with self._lock:
+            self._buckets.clear()
+            self._stats.clear()
+
+
+class CacheStore:
+    """Корзины в кэше Django, общие для процессов с одним кэшем.
+
+    Чтение и запись не атомарны: при одновременных запросах одного
+    клиента лимит может быть превышен на несколько запросов.
+    """
+
+    def consume(self, buckets, now):
+        """Списание токенов: чтение и запись корзин кэша."""
+        keys = {key: BUCKET_KEY.format(key) for key, *_ in buckets}
+        cached = cache.get_many(keys.values())
+        states, key, wait = take(
+            {key: cached.get(cache_key) for key, cache_key in keys.items()},
+            buckets, now)
+        for bucket, state in states.items():
+            cache.set(keys[bucket], state, math.ceil(state[2] - now) + 1)
+        return key, wait
+
+    def count(self, name):
+        """Увеличивает счётчик."""
+        key = STATS_KEY.format(*name)
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+
+    def stats(self, names):
+        """Значения счётчиков."""
+        values = cache.get_many(STATS_KEY.format(*name) for name in names)
+        return {name: values.get(STATS_KEY.format(*name), 0)
+                for name in names}
+
+    def clear(self):
+        """Сбрасывает счётчики, корзины истекают сами."""
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        cache.delete_many(STATS_KEY.format(scope, stat)
+                          for scope in rates for stat in STATS)
+
+
+STORES = {
+    'local': LocalStore(),
+    'cache': CacheStore(),
+}
+
+
+def get_store():
+    """Хранилище корзин из настройки THROTTLE_STORAGE."""
+    return STORES[settings.THROTTLE_STORAGE]
+
+
+def shared_stats():
+    """Счётчики общие для воркеров: корзины в кэше или задан CACHE_LOCATION."""
+    return settings.THROTTLE_STORAGE == 'cache' or bool(
+        settings.CACHE_LOCATION)
+
+
+def get_stats_store():
+    """Хранилище счётчиков: общий кэш, если он есть, иначе память процесса."""
+    return STORES['cache'] if shared_stats() else STORES['local']
+
+
+def throttle_stats():
+    """Скорости и счётчики групп лимитов для подбора значений.
+
+    Без общего кэша счётчики свои у каждого воркера, и ответ содержит
+    только счётчики обработавшего запрос процесса (его pid в worker).
+    """
+    rates = api_settings.DEFAULT_THROTTLE_RATES
+    scopes = sorted(scope for scope in rates if not scope.endswith('.total'))
+    counters = get_stats_store().stats(
+        [(scope, stat) for scope in scopes for stat in STATS])
+    return {
+        'storage': settings.THROTTLE_STORAGE,
+        'enabled': settings.THROTTLE_ENABLED,
+        'counters': 'shared' if shared_stats() else 'worker',
+        'worker': os.getpid(),
+        'scopes': {
+            scope: {
+                'rate': rates[scope],
+                'total_rate': rates.get(TOTAL.format(scope)),
+                **{stat: counters[scope, stat] for stat in STATS},
+            }
+            for scope in scopes
+        },
+    }
+
+
+class CostThrottle(BaseThrottle):
+    """Лимит дорогих действий по корзинам пользователя и действия."""
+
+    def allow_request(self, request, view):
+        """Списывает стоимость действия или отклоняет запрос."""
+        self.delay = None
+        action = getattr(view, 'action', None)
+        costs = getattr(view, 'throttle_costs', {})
+        if not settings.THROTTLE_ENABLED or action not in costs:
+            return True
+        scope, cost = costs[action]
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        ident = (f'user:{request.user.pk}' if request.user.is_authenticated
+                 else f'ip:{self.get_ident(request)}')
+        buckets = []
+        for key, rate in ((f'{scope}:{ident}', rates.get(scope)),
+                          (TOTAL.format(scope),
+                           rates.get(TOTAL.format(scope)))):
+            rate = parse_rate(rate)
+            if rate is not None:
+                capacity, per_second = rate
+                # Дороже вместимости нельзя: такой запрос не прошёл бы никогда.
+                buckets.append(
+                    (key, capacity, per_second, min(cost, capacity)))
+        if not buckets:
+            return True
+
+        key, wait = get_store().consume(buckets, time.time())
+        stats = get_stats_store()
+        if key is None:
+            stats.count((scope, 'allowed'))
+            return True
+        limit = 'total' if key == TOTAL.format(scope) else 'user'
+        stats.count((scope, f'throttled_{limit}'))
+        self.delay = math.ceil(wait)
+        logger.info(json.dumps({
+            'event': 'throttled',
+            'scope': scope,
+            'limit': limit,
+            'ident': ident,
+            'path': request.path,
+            'retry_after': self.delay,
+        }, ensure_ascii=False))
+        return False
+
+    def wait(self):
+        """Секунды до пополнения корзины, для заголовка Retry-After."""
+        return self.delay
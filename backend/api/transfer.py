@@ -0,0 +1,219 @@
+"""Перенос рецептов между окружениями в формате NDJSON.
+
+Одна строка - один рецепт. Автор задаётся email, теги слагами,
+ингредиенты названием и единицей измерения, изображение именем файла
+в хранилище (сами файлы переносятся отдельно). Экспорт читает рецепты
+серверным курсором пачками, импорт создаёт их пачками через
+bulk_create, каждая пачка в своей транзакции.
+"""
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from recipe.models import Ingredient, Recipe, RecipeIngredient, Tag
+from .autocomplete import ingredient_index
+from .conditional import INGREDIENTS
+from .constants import TRANSFER_BATCH_SIZE, TRANSFER_CHUNK_SIZE
+from .images import enqueue_images
+from .search import update_search_index
+from .signals import bump_counters_on_commit, touch_recipes_on_commit
+
+User = get_user_model()
+RECIPE_KEYS = ('name', 'text', 'cooking_time', 'author')
+
+
+def chunked(items, size):
+    """Разбивает поток на списки размером size."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_recipes(chunk_size=TRANSFER_CHUNK_SIZE):
+    """Строки NDJSON со всеми рецептами в порядке id.
+
+    На пачку рецептов приходится по одному запросу тегов
+    и ингредиентов, память не зависит от числа рецептов.
+    """
+    rows = Recipe.objects.order_by('id').values_list(
+        'id', 'name', 'text', 'cooking_time', 'image', 'pub_date',
+        'author__email'
+    ).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        ids = [row[0] for row in chunk]
+        tags = defaultdict(list)
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=ids).order_by('tag_id').values_list(
+                'recipe_id', 'tag__slug'):
+            tags[recipe_id].append(slug)
+        ingredients = defaultdict(list)
+        for recipe_id, name, unit, amount in RecipeIngredient.objects.filter(
+                recipe_id__in=ids).order_by('id').values_list(
+                'recipe_id', 'ingredients__name',
+                'ingredients__measurement_unit', 'amount'):
+            ingredients[recipe_id].append(
+                {'name': name, 'measurement_unit': unit, 'amount': amount})
+        for pk, name, text, cooking_time, image, pub_date, email in chunk:
+            yield json.dumps({
+                'name': name,
+                'text': text,
+                'cooking_time': cooking_time,
+                'image': image,
+                'pub_date': pub_date.isoformat(),
+                'author': email,
+                'tags': tags[pk],
+                'ingredients': ingredients[pk],
+            }, ensure_ascii=False) + '\n'
+
+
+def parse_lines(lines):
+    """Рецепты из строк NDJSON, пустые строки пропускаются."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            missing = [key for key in RECIPE_KEYS if key not in record]
+            if missing:
+                raise ValueError(f'нет полей {", ".join(missing)}')
+            record['cooking_time'] = int(record['cooking_time'])
+            record['ingredients'] = [
+                (item['name'], item['measurement_unit'], int(item['amount']))
+                for item in record.get('ingredients', ())]
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(f'Строка {number}: {error}')
+        yield record
+
+
+def ingredient_ids(items):
+    """Id ингредиентов по паре (название, единица), недостающие создаются.
+
+    Возвращает словарь и число созданных ингредиентов. bulk_create
+    не отправляет сигналы, поэтому индекс автодополнения и счётчик
+    ингредиентов сбрасываются здесь, как в load_ingredients.
+    """
+    keys = {(name, unit) for name, unit, _ in items}
+
+    def load():
+        return {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('id', 'name', 'measurement_unit')
+            if (name, unit) in keys
+        }
+
+    ids = load()
+    missing = keys - set(ids)
+    if not missing:
+        return ids, 0
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=unit)
+         for name, unit in missing),
+        ignore_conflicts=True)
+    transaction.on_commit(ingredient_index.invalidate)
+    bump_counters_on_commit(INGREDIENTS)
+    return load(), len(missing)
+
+
+def import_batch(records):
+    """Создаёт рецепты пачки и возвращает счётчики.
+
+    Рецепты неизвестных авторов и уже существующие пропускаются:
+    название уникально у автора (unique_author_recipe), поэтому
+    повтор пары автор и название в БД или в самой пачке - пропуск.
+    """
+    authors = dict(User.objects.filter(
+        email__in={record['author'] for record in records}
+    ).values_list('email', 'id'))
+    existing = set(Recipe.objects.filter(
+        author_id__in=authors.values(),
+        name__in={record['name'] for record in records},
+    ).values_list('author_id', 'name'))
+    tags = dict(Tag.objects.filter(slug__in={
+        slug for record in records for slug in record.get('tags', ())
+    }).values_list('slug', 'id'))
+
+    accepted, recipes = [], []
+    for record in records:
+        author_id = authors.get(record['author'])
+        pub_date = parse_datetime(record.get('pub_date') or '')
+        if author_id is None or (author_id, record['name']) in existing:
+            continue
+        existing.add((author_id, record['name']))
+        accepted.append(record)
+        recipes.append(Recipe(
+            author_id=author_id, name=record['name'], text=record['text'],
+            cooking_time=record['cooking_time'],
+            image=record.get('image') or '', pub_date=pub_date))
+    if not recipes:
+        return {'created': 0, 'skipped': len(records), 'ingredients': 0}
+
+    pub_dates = [recipe.pub_date for recipe in recipes]
+    Recipe.objects.bulk_create(recipes)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # Без RETURNING (SQLite) id находятся по уникальной паре.
+        rows = Recipe.objects.filter(
+            author_id__in={recipe.author_id for recipe in recipes},
+            name__in={recipe.name for recipe in recipes},
+        ).values_list('id', 'author_id', 'name')
+        ids = {(author_id, name): pk for pk, author_id, name in rows}
+        for recipe in recipes:
+            recipe.pk = ids[recipe.author_id, recipe.name]
+    # auto_now_add перезаписывает дату при вставке.
+    dated = []
+    for recipe, pub_date in zip(recipes, pub_dates):
+        if pub_date is not None:
+            recipe.pub_date = pub_date
+            dated.append(recipe)
+    Recipe.objects.bulk_update(dated, ('pub_date',))
+
+    ingredients, created_ingredients = ingredient_ids(
+        item for record in accepted for item in record['ingredients'])
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe,
+                         ingredients_id=ingredients[name, unit],
+                         amount=amount)
+        for recipe, record in zip(recipes, accepted)
+        for name, unit, amount in record['ingredients'])
+    Recipe.tags.through.objects.bulk_create(
+        (Recipe.tags.through(recipe=recipe, tag_id=tags[slug])
+         for recipe, record in zip(recipes, accepted)
+         for slug in set(record.get('tags', ())) if slug in tags),
+        ignore_conflicts=True)
+
+    for author_id, count in Counter(
+            recipe.author_id for recipe in recipes).items():
+        User.objects.filter(pk=author_id).update(
+            recipes_count=F('recipes_count') + count)
+    recipe_ids = [recipe.pk for recipe in recipes]
+    update_search_index(recipe_ids)
+    images = [recipe.pk for recipe in recipes if recipe.image]
+    if images:
+        enqueue_images(Recipe._meta.label_lower, images)
+    touch_recipes_on_commit(recipe_ids)
+    return {'created': len(recipes), 'skipped': len(records) - len(recipes),
+            'ingredients': created_ingredients}
+
+
+def import_recipes(lines, batch_size=TRANSFER_BATCH_SIZE):
+    """Импорт рецептов из строк NDJSON пачками по batch_size.
+
+    Каждая пачка сохраняется в своей транзакции: при ошибке
+    в строке предыдущие пачки остаются сохранёнными.
+    """
+    totals = Counter(created=0, skipped=0, ingredients=0)
+    for batch in chunked(parse_lines(lines), batch_size):
+        with transaction.atomic():
+            totals.update(import_batch(batch))
+    return dict(totals)
@@ -1,8 +1,9 @@
 from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
-from user.views import UserViewSet
+from .views import (IngredientViewSet, RecipeViewSet, TagViewSet,
+                    ThrottleStatsView)
+from user.views import TokenCreateView, TokenDestroyView, UserViewSet
 
 
 router = DefaultRouter()
@@ -13,5 +14,9 @@ router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 
 urlpatterns = [
     path('', include(router.urls)),
-    re_path(r'auth/', include('djoser.urls.authtoken')),
+    path('throttles/', ThrottleStatsView.as_view(), name='throttles'),
+    re_path(r'^auth/token/login/?$', TokenCreateView.as_view(),
+            name='login'),
+    re_path(r'^auth/token/logout/?$', TokenDestroyView.as_view(),
+            name='logout'),
 ]
@@ -1,44 +1,210 @@
 """Файл доп функций."""
-import secrets
-
-from django.shortcuts import get_object_or_404
+from django.db import connection, transaction
+from django.http import Http404
 from rest_framework import status
 from rest_framework.response import Response
 
+from recipe.models import Favourite, Recipe
+from .conditional import FAVOURITES, USER
+from .serializers import RecipeIdsSerializer
+from .signals import bump_counters_on_commit, shift_counter
+
+RECIPE_COLUMNS = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+# Счётчики рецепта, которые меняются вместе со списком пользователя.
+RECIPE_COUNTERS = {Favourite: ('favorites_count', FAVOURITES)}
+
+
+def counter_update(model, changed, delta):
+    """CTE, меняющий счётчик рецептов из CTE changed."""
+    if model not in RECIPE_COUNTERS:
+        return ''
+    field = connection.ops.quote_name(RECIPE_COUNTERS[model][0])
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    return (f', counted AS (UPDATE {table} '
+            f'SET {field} = GREATEST({field} + {delta:d}, 0) FROM {changed} '
+            f'WHERE {table}.id = {changed}.recipe_id)')
+
+
+def bump_on_commit(model, user):
+    """Счётчики изменений пользователя и, если есть, счётчика рецепта."""
+    names = [USER.format(user.pk)]
+    if model in RECIPE_COUNTERS:
+        names.append(RECIPE_COUNTERS[model][1])
+    bump_counters_on_commit(*names)
+
+
+def shift_recipe_counter(model, recipe_ids, delta):
+    """Меняет счётчик рецептов списка без CTE (не PostgreSQL)."""
+    if model in RECIPE_COUNTERS and recipe_ids:
+        shift_counter(Recipe.objects.filter(pk__in=recipe_ids),
+                      RECIPE_COUNTERS[model][0], delta)
+
+
+def add_recipes_portable(model, user, recipe_ids):
+    """Добавление рецептов в список для СУБД без изменяющих CTE."""
+    with transaction.atomic():
+        recipes = list(Recipe.objects.filter(pk__in=recipe_ids).only(
+            *RECIPE_COLUMNS).order_by('id'))
+        existing = set(model.objects.filter(
+            author=user, recipe_id__in=[recipe.pk for recipe in recipes]
+        ).values_list('recipe_id', flat=True))
+        for recipe in recipes:
+            recipe.added = recipe.pk not in existing
+        added = [recipe.pk for recipe in recipes if recipe.added]
+        model.objects.bulk_create(
+            (model(author=user, recipe_id=pk) for pk in added),
+            ignore_conflicts=True)
+        shift_recipe_counter(model, added, 1)
+    return recipes
+
+
+def remove_recipes_portable(model, user, recipe_ids):
+    """Удаление рецептов из списка для СУБД без изменяющих CTE."""
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        found = list(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', flat=True))
+        present = list(model.objects.filter(
+            author=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        if present:
+            placeholders = ', '.join(['%s'] * len(present))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {quote(model._meta.db_table)} '
+                    f'WHERE author_id = %s AND recipe_id IN ({placeholders})',
+                    (user.pk, *present))
+        shift_recipe_counter(model, present, -1)
+    present = set(present)
+    return {pk: pk in present for pk in found}
+
+
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в список пользователя одним запросом.
 
-def generate_unique_short_code(model, recipe):
-    """Метод для генераций уникального кода."""
-    pk = recipe.pk
-    while True:
-        short_code = secrets.token_hex(3)[:6]
-        if not model.objects.filter(pk=pk, short_code=short_code).exists():
-            return short_code
+    INSERT ... ON CONFLICT DO NOTHING без гонки между проверкой и
+    вставкой, счётчик рецепта меняется в том же запросе. Возвращает
+    найденные рецепты с флагом added: False, если рецепт уже был
+    в списке. Сигналы не отправляются. На других СУБД - несколько
+    запросов в транзакции.
+    """
+    if connection.vendor != 'postgresql':
+        recipes = add_recipes_portable(model, user, recipe_ids)
+        if any(recipe.added for recipe in recipes):
+            bump_on_commit(model, user)
+        return recipes
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in RECIPE_COLUMNS)
+    recipes = list(Recipe.objects.raw(
+        f'WITH recipe AS (SELECT {columns} FROM {quote(Recipe._meta.db_table)}'
+        ' WHERE id = ANY(%s)), '
+        f'added AS (INSERT INTO {quote(model._meta.db_table)} '
+        '(author_id, recipe_id) SELECT %s, id FROM recipe '
+        'ON CONFLICT DO NOTHING RETURNING recipe_id)'
+        f'{counter_update(model, "added", 1)} '
+        'SELECT recipe.*, added.recipe_id IS NOT NULL AS added FROM recipe '
+        'LEFT JOIN added ON added.recipe_id = recipe.id ORDER BY recipe.id',
+        (list(recipe_ids), user.pk)
+    ))
+    if any(recipe.added for recipe in recipes):
+        bump_on_commit(model, user)
+    return recipes
+
+
+def remove_recipes(model, user, recipe_ids):
+    """Удаляет рецепты из списка пользователя одним запросом.
+
+    Возвращает словарь id найденного рецепта -> был ли он в списке.
+    Сигналы не отправляются. На других СУБД - несколько запросов
+    в транзакции.
+    """
+    if connection.vendor != 'postgresql':
+        removed = remove_recipes_portable(model, user, recipe_ids)
+        if any(removed.values()):
+            bump_on_commit(model, user)
+        return removed
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH removed AS (DELETE FROM {quote(model._meta.db_table)} '
+            'WHERE author_id = %s AND recipe_id = ANY(%s) '
+            'RETURNING recipe_id)'
+            f'{counter_update(model, "removed", -1)} '
+            'SELECT recipe.id, removed.recipe_id IS NOT NULL '
+            f'FROM {quote(Recipe._meta.db_table)} recipe '
+            'LEFT JOIN removed ON removed.recipe_id = recipe.id '
+            'WHERE recipe.id = ANY(%s)',
+            (user.pk, list(recipe_ids), list(recipe_ids))
+        )
+        removed = dict(cursor.fetchall())
+    if any(removed.values()):
+        bump_on_commit(model, user)
+    return removed
 
 
 def action_method(model, serializer_class, **kwargs):
-    """Метод для action методов в RecipeViewSet."""
-    recipe = kwargs.get('recipe')
+    """Метод для action методов в RecipeViewSet.
+
+    Добавление и удаление выполняются одним запросом, код ответа
+    определяется по числу затронутых строк.
+    """
+    pk = kwargs.get('pk')
     user = kwargs.get('user')
     request = kwargs.get('request')
     name = kwargs.get('name')
+    if not str(pk).isdigit():
+        raise Http404
+    pk = int(pk)
 
     if request.method == 'POST':
-        if model.objects.filter(recipe=recipe, author=user).exists():
+        recipes = add_recipes(model, user, (pk,))
+        if not recipes:
+            raise Http404
+        recipe, = recipes
+        if not recipe.added:
             return Response({'errors': 'Рецепт уже добавлен!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        serializer = serializer_class(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(author=user, recipe=recipe)
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED
-            )
-        return Response(serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST)
-
-    if model.objects.filter(recipe=recipe, author=user).exists():
-        obj = get_object_or_404(model, recipe=recipe, author=user)
-        obj.delete()
+        serializer = serializer_class(
+            model(author=user, recipe=recipe), context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    removed = remove_recipes(model, user, (pk,))
+    if pk not in removed:
+        raise Http404
+    if removed[pk]:
         return Response(f'Рецепт успешно удалён из {name}.',
                         status=status.HTTP_204_NO_CONTENT)
     return Response({'errors': 'Объект не найден'},
                     status=status.HTTP_400_BAD_REQUEST)
+
+
+def bulk_action_method(model, serializer_class, **kwargs):
+    """Добавление и удаление пачки рецептов в списке пользователя.
+
+    Повторное добавление и удаление отсутствующих не считаются ошибкой.
+    """
+    user = kwargs.get('user')
+    request = kwargs.get('request')
+    serializer = RecipeIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    recipe_ids = set(serializer.validated_data['recipes'])
+
+    if request.method == 'POST':
+        recipes = add_recipes(model, user, recipe_ids)
+        found = {recipe.pk for recipe in recipes}
+        added = [recipe for recipe in recipes if recipe.added]
+        return Response({
+            'added': serializer_class(
+                (model(author=user, recipe=recipe) for recipe in added),
+                many=True, context={'request': request}).data,
+            'existing': sorted(recipe.pk for recipe in recipes
+                               if not recipe.added),
+            'not_found': sorted(recipe_ids - found),
+        }, status=status.HTTP_201_CREATED if added else status.HTTP_200_OK)
+
+    removed = remove_recipes(model, user, recipe_ids)
+    removed = {pk for pk, was_removed in removed.items() if was_removed}
+    return Response({
+        'removed': sorted(removed),
+        'not_found': sorted(recipe_ids - removed),
+    }, status=status.HTTP_200_OK)
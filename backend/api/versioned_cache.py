@@ -0,0 +1,61 @@
+"""Данные из БД в памяти процесса с версией в кэше Django."""
+import threading
+import time
+
+from django.core.cache import cache
+
+
+class VersionedCache:
+    """Данные процесса, которые перестраиваются из БД лениво.
+
+    Перестроение происходит при смене версии в кэше Django (её
+    увеличивает invalidate, обычно из сигналов) либо по истечении ttl
+    секунд: с LocMemCache версия своя у каждого процесса, и изменения
+    из других воркеров видны только после ttl. Подклассы задают
+    version_key, ttl и метод load.
+    """
+
+    version_key = None
+    ttl = None
+
+    def __init__(self):
+        """Пустые данные, строятся при первом обращении."""
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = None
+
+    def _is_stale(self, version):
+        return (self._built_at is None
+                or version != self._version
+                or time.monotonic() - self._built_at > self.ttl)
+
+    def load(self):
+        """Загружает данные из БД."""
+        raise NotImplementedError
+
+    def build(self, version=None):
+        """Загружает данные и запоминает версию."""
+        self.load()
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Перестраивает данные, если они устарели."""
+        version = cache.get(self.version_key, 0)
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self.build(version)
+
+    def rebuild(self):
+        """Перестраивает данные сразу, не меняя версию."""
+        with self._lock:
+            self.build(self._version)
+
+    def invalidate(self):
+        """Помечает данные устаревшими во всех процессах."""
+        self._built_at = None
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, timeout=None)
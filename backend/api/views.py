@@ -1,17 +1,31 @@
+from functools import partial
+
 from django.conf import settings
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import HttpResponseNotFound, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
-from rest_framework import mixins, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated, SAFE_METHODS
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated, SAFE_METHODS)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from api.pagination import CustomPagination
-from .filters import IngredientSearchFilter, RecipeFilter
+from api.pagination import KeysetPagination, RecipePagination
+from . import shopping_list
+from .constants import (NDJSON_CONTENT_TYPE,
+                        RECIPE_THROTTLE_COSTS,
+                        RECIPES_EXPORT_FILENAME,
+                        SHOPPING_LIST_DEFAULT_FORMAT,
+                        SHOPPING_LIST_FILENAME)
+from .autocomplete import ingredient_index
+from .conditional import (FAVOURITES, INGREDIENTS, RECIPES, TAGS,
+                          conditional_response)
+from .filters import RecipeFilter
 from .permissions import IsOwnerOrAdminOrReadOnly
+from .response_cache import cached_response, is_popular
 from recipe.models import (
-    Favourite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+    Favourite, Ingredient, Recipe, ShoppingCart, Tag
 )
 from .serializers import (FavouriteSerializer,
                           IngredientSerializer,
@@ -19,7 +33,10 @@ from .serializers import (FavouriteSerializer,
                           RecipeWriteSerializer,
                           ShoppingCartSerializer,
                           TagSerializer)
-from .utils import action_method, generate_unique_short_code
+from .short_links import get_short_code, resolve_short_code
+from .throttling import throttle_stats
+from .transfer import export_recipes, import_recipes
+from .utils import action_method, bulk_action_method
 
 
 class TagViewSet(mixins.ListModelMixin,
@@ -31,6 +48,16 @@ class TagViewSet(mixins.ListModelMixin,
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
 
+    def list(self, request, *args, **kwargs):
+        """Список тегов с поддержкой условных запросов."""
+        render = partial(super().list, request, *args, **kwargs)
+        return conditional_response(request, (TAGS,), render)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Тег с поддержкой условных запросов."""
+        render = partial(super().retrieve, request, *args, **kwargs)
+        return conditional_response(request, (TAGS,), render)
+
 
 class IngredientViewSet(mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
@@ -40,21 +67,47 @@ class IngredientViewSet(mixins.ListModelMixin,
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny, )
-    filter_backends = (IngredientSearchFilter, )
-    # У меня с поиском всё работает, и тесты в постмане проходят
-    # Не понимаю почему не работает
-    search_fields = ('name',)  # символ убрал может теперь получится.
+
+    def list(self, request, *args, **kwargs):
+        """Метод списка ингредиентов.
+
+        Поиск по параметру name обслуживается индексом в памяти
+        без обращения к БД: сначала совпадения по префиксу, затем
+        по подстроке. Полный каталог поддерживает условные запросы.
+        """
+        name = request.query_params.get('name')
+        if name is not None:
+            return Response(ingredient_index.search(name))
+        render = partial(super().list, request, *args, **kwargs)
+        return conditional_response(request, (INGREDIENTS,), render)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Ингредиент с поддержкой условных запросов."""
+        render = partial(super().retrieve, request, *args, **kwargs)
+        return conditional_response(request, (INGREDIENTS,), render)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет Рецептов."""
 
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ('get', 'post', 'patch', 'delete')
+    throttle_costs = RECIPE_THROTTLE_COSTS
+
+    def get_queryset(self):
+        """Метод получения кверисета.
+
+        Для чтения используется оптимизированный режим с аннотациями
+        флагов пользователя и пакетной подгрузкой связанных объектов.
+        """
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            return queryset.for_read(self.request.user)
+        return queryset
 
     def get_serializer_class(self):
         """Метод установки класс сеализатора."""
@@ -62,17 +115,53 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def list(self, request, *args, **kwargs):
+        """Список рецептов через условный запрос и кэш ответов."""
+        render = partial(super().list, request, *args, **kwargs)
+        names = (RECIPES, FAVOURITES) if is_popular(request) else (RECIPES,)
+        return conditional_response(
+            request, names, partial(cached_response, request, render),
+            personal=True)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт через условный запрос и кэш ответов."""
+        render = partial(super().retrieve, request, *args, **kwargs)
+        pk = kwargs.get('pk', '')
+        if pk.isdigit():
+            render = partial(cached_response, request, render, pk=int(pk))
+        return conditional_response(request, (RECIPES,), render,
+                                    personal=True)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated, ])
+    def feed(self, request, *args, **kwargs):
+        """Лента рецептов авторов из подписок.
+
+        Всегда курсорная пагинация по (pub_date, id), фильтры
+        те же, что у списка рецептов.
+        """
+        def render():
+            queryset = self.filter_queryset(
+                self.get_queryset().feed(request.user))
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(queryset, request, self)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        return conditional_response(request, (RECIPES,), render,
+                                    personal=True)
+
     @action(detail=True,
             methods=['get', ],
             url_path='get-link',
             permission_classes=[AllowAny, ])
     def get_link(self, request, pk=None):
         """Метод для получения короткой ссылки."""
-        recipe = self.get_object()
+        recipe = get_object_or_404(
+            Recipe.objects.only('pk', 'short_code'), pk=pk)
         base_url = settings.BASE_URL
-        short_code = generate_unique_short_code(Recipe, recipe)
-        recipe.short_code = short_code
-        recipe.save()
+        short_code = get_short_code(recipe)
         short_link = f'{base_url}/r/{short_code}/'
         return Response({'short-link': short_link}, status=200)
 
@@ -81,71 +170,120 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated, ])
     def favorite(self, request, *args, **kwargs):
         """Метод для добавления избранного."""
-        recipe = get_object_or_404(Recipe, pk=self.kwargs.get('pk'))
-        user = self.request.user
-        response = action_method(Favourite,
-                                 FavouriteSerializer,
-                                 recipe=recipe,
-                                 user=user,
-                                 request=request,
-                                 name='Избранный')
-        return response
+        return action_method(Favourite,
+                             FavouriteSerializer,
+                             pk=self.kwargs.get('pk'),
+                             user=request.user,
+                             request=request,
+                             name='Избранный')
 
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated, ])
     def shopping_cart(self, request, *args, **kwargs):
         """Метод для добавления в список покупок."""
-        recipe = get_object_or_404(Recipe, pk=self.kwargs.get('pk'))
-        user = self.request.user
-        response = action_method(ShoppingCart,
-                                 ShoppingCartSerializer,
-                                 recipe=recipe,
-                                 user=user,
-                                 request=request,
-                                 name='Список Покупок')
-        return response
+        return action_method(ShoppingCart,
+                             ShoppingCartSerializer,
+                             pk=self.kwargs.get('pk'),
+                             user=request.user,
+                             request=request,
+                             name='Список Покупок')
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='favorite',
+            permission_classes=[IsAuthenticated, ])
+    def favorite_bulk(self, request, *args, **kwargs):
+        """Пакетное добавление и удаление избранного."""
+        return bulk_action_method(Favourite,
+                                  FavouriteSerializer,
+                                  user=request.user,
+                                  request=request)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='shopping_cart',
+            permission_classes=[IsAuthenticated, ])
+    def shopping_cart_bulk(self, request, *args, **kwargs):
+        """Пакетное добавление и удаление в списке покупок."""
+        return bulk_action_method(ShoppingCart,
+                                  ShoppingCartSerializer,
+                                  user=request.user,
+                                  request=request)
 
     @action(detail=False,
             methods=['get'],
             permission_classes=[IsAuthenticated, ])
     def download_shopping_cart(self, request, *args, **kwargs):
-        """Метод для скачивания списка покупок."""
-        shopping_cart_items = (ShoppingCart
-                               .objects
-                               .filter(author=request.user)
-                               .select_related('recipe'))
-        if not shopping_cart_items.exists():
-            return HttpResponse('Your shopping cart is empty.',
-                                content_type='text/plain')
-
-        shopping_list = {}
-        for item in shopping_cart_items:
-            ingredients = RecipeIngredient.objects.filter(recipe=item.recipe)
-            for ingredient in ingredients:
-                key_name = (f'* {ingredient.ingredients.name} '
-                            f'({ingredient.ingredients.measurement_unit}) -')
-                if shopping_list.get(key_name, None):
-                    shopping_list[key_name] += ingredient.amount
-                    continue
-                shopping_list[key_name] = ingredient.amount
-
-        file_content = 'Список покупок: \n'
-        for ingredient, amount in shopping_list.items():
-            file_content += f'{ingredient} {amount} \n'
-        filename = 'shopping_list.txt'
-
-        response = HttpResponse(file_content, content_type='text/plain')
+        """Метод для скачивания списка покупок.
+
+        Формат файла задаётся параметром type: txt, csv или pdf.
+        """
+        file_format = request.query_params.get(
+            'type', SHOPPING_LIST_DEFAULT_FORMAT)
+        if file_format not in shopping_list.FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: '
+                           f'{", ".join(shopping_list.FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        render, content_type = shopping_list.FORMATS[file_format]
+        rows = shopping_list.get_shopping_list(request.user)
+        response = StreamingHttpResponse(render(rows),
+                                         content_type=content_type)
+        filename = f'{SHOPPING_LIST_FILENAME}.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
 
+    @action(detail=False,
+            methods=['get'],
+            url_path='export',
+            permission_classes=[IsAdminUser, ])
+    def export_ndjson(self, request, *args, **kwargs):
+        """Потоковая выгрузка всех рецептов в NDJSON."""
+        response = StreamingHttpResponse(export_recipes(),
+                                         content_type=NDJSON_CONTENT_TYPE)
+        response['Content-Disposition'] = (
+            f'attachment; filename={RECIPES_EXPORT_FILENAME}')
         return response
 
+    @action(detail=False,
+            methods=['post'],
+            url_path='import',
+            permission_classes=[IsAdminUser, ])
+    def import_ndjson(self, request, *args, **kwargs):
+        """Загрузка рецептов из тела запроса в NDJSON.
+
+        Тело читается построчно, рецепты создаются пачками.
+        """
+        try:
+            totals = import_recipes(request.stream or ())
+        except ValueError as error:
+            return Response({'errors': str(error)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(totals, status=status.HTTP_201_CREATED
+                        if totals['created'] else status.HTTP_200_OK)
+
+
+class ThrottleStatsView(APIView):
+    """Счётчики лимитов дорогих действий для администраторов.
+
+    С общим кэшем (CACHE_LOCATION или THROTTLE_STORAGE=cache) счётчики
+    общие для всех воркеров. Без него каждый воркер считает сам, и ответ
+    показывает только счётчики воркера, обработавшего запрос: поле
+    counters равно worker, а worker содержит pid процесса.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        """Скорости групп и число пропущенных и отклонённых запросов."""
+        return Response(throttle_stats())
+
 
 def redirect_from_short_link(request, short_code):
     """Вью функция для переадресаций от короткой ссылки."""
-    try:
-        recipe = get_object_or_404(Recipe, short_code=short_code)
-        base_url = settings.BASE_URL
-        return redirect(f'{base_url}/recipes/{recipe.pk}')
-    except Exception:
+    pk = resolve_short_code(short_code)
+    if pk is None:
         return HttpResponseNotFound('Ошибка в ссылке!')
+    base_url = settings.BASE_URL
+    return redirect(f'{base_url}/recipes/{pk}')
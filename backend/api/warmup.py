@@ -0,0 +1,88 @@
+"""Прогрев процесса перед форком воркеров gunicorn.
+
+Всё, что иначе лениво делает первый запрос каждого воркера: разбор
+маршрутов, импорт рендереров и парсеров DRF, сборка полей
+сериализаторов и кэшей _meta моделей, справочники в памяти процесса.
+Соединения с БД закрываются, чтобы воркеры не унаследовали их.
+Если БД ещё недоступна или не мигрирована, справочники загрузят
+воркеры при первом обращении.
+"""
+import logging
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+from django.urls import get_resolver, resolve
+from PIL import Image
+from rest_framework.settings import api_settings
+
+from user.serializers import (UserAvatarSerializer,
+                              UserReadSerializer,
+                              UserSerializer)
+from .authentication import revocation_list
+from .autocomplete import ingredient_index
+from .serializers import (FollowSerializer,
+                          IngredientSerializer,
+                          RecipeReadSerializer,
+                          RecipeWriteSerializer,
+                          TagSerializer)
+from .shopping_list import get_pdf_font
+from .tag_map import tag_map
+
+logger = logging.getLogger('api.warmup')
+
+WARM_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/1/',
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/users/',
+    '/api/users/me/',
+    '/api/users/subscriptions/',
+    '/api/auth/token/login/',
+)
+API_SETTINGS = (
+    'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES',
+    'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_PAGINATION_CLASS',
+    'DEFAULT_FILTER_BACKENDS',
+    'DEFAULT_THROTTLE_CLASSES',
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_METADATA_CLASS',
+    'DEFAULT_VERSIONING_CLASS',
+)
+SERIALIZERS = (
+    FollowSerializer,
+    IngredientSerializer,
+    RecipeReadSerializer,
+    RecipeWriteSerializer,
+    TagSerializer,
+    UserAvatarSerializer,
+    UserReadSerializer,
+    UserSerializer,
+)
+
+
+def warm_up():
+    """Прогревает процесс."""
+    get_resolver().url_patterns
+    for path in WARM_PATHS:
+        resolve(path)
+    for name in API_SETTINGS:
+        getattr(api_settings, name)
+    for serializer_class in SERIALIZERS:
+        serializer_class().fields
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta.related_objects
+    Image.init()
+    get_pdf_font()
+    try:
+        ingredient_index.ensure_fresh()
+        tag_map.ensure_fresh()
+        revocation_list.ensure_fresh()
+    except DatabaseError as error:
+        logger.warning('Справочники не прогреты, БД недоступна: %s', error)
+    finally:
+        connections.close_all()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -39,6 +40,7 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split()
 INSTALLED_APPS = [
     'user.apps.UserConfig',
     'recipe.apps.RecipeConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -54,6 +56,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'user.CustomUser'
 
 MIDDLEWARE = [
+    'api.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,6 +151,8 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы хранятся под именами по содержимому, см. api/storage.py.
+DEFAULT_FILE_STORAGE = 'api.storage.ContentAddressedStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -161,8 +166,39 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.SignedTokenAuthentication',
     ],
+
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.CostThrottle',
+    ],
+    # Корзины токенов дорогих действий: «группа» - на пользователя,
+    # «группа.total» - на всех клиентов; пустое значение снимает лимит.
+    'DEFAULT_THROTTLE_RATES': {
+        'recipe_write': os.getenv('THROTTLE_RECIPE_WRITE', '60/min'),
+        'recipe_write.total': os.getenv(
+            'THROTTLE_RECIPE_WRITE_TOTAL', '1200/min'),
+        'shopping_cart': os.getenv('THROTTLE_SHOPPING_CART', '20/min'),
+        'shopping_cart.total': os.getenv(
+            'THROTTLE_SHOPPING_CART_TOTAL', '600/min'),
+        'avatar': os.getenv('THROTTLE_AVATAR', '20/min'),
+        'avatar.total': os.getenv('THROTTLE_AVATAR_TOTAL', '600/min'),
+    },
+}
+
+# Хранилище корзин лимитов: local - память воркера, cache - кэш Django
+# (общий для воркеров при CACHE_LOCATION).
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_STORAGE = os.getenv('THROTTLE_STORAGE', 'local')
+
+# Режим токенов входа: db - токены в таблице authtoken_token,
+# signed - подписанные токены, которые проверяются без запросов к БД.
+AUTH_TOKEN_MODE = os.getenv('AUTH_TOKEN_MODE', 'db')
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        hours=int(os.getenv('AUTH_TOKEN_LIFETIME_HOURS', 24 * 7))),
+    'USER_ID_FIELD': 'id',
+    'USER_ID_CLAIM': 'user_id',
 }
 
 DJOSER = {
@@ -171,3 +207,41 @@ DJOSER = {
 }
 
 BASE_URL = os.getenv('BASE_URL')
+
+# Шрифт с кириллицей для PDF списка покупок.
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Общий для воркеров gunicorn файловый кэш включается CACHE_LOCATION,
+# без неё используется кэш в памяти процесса.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    } if not CACHE_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 5))
+
+# Запросы дольше порога попадают в лог api.timing.
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 500))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,43 @@
+"""Профиль gunicorn для продакшена.
+
+Приложение загружается и прогревается в мастер-процессе до форка,
+после чего объекты замораживаются gc.freeze(): сборщик мусора воркеров
+не трогает их страницы, и память остаётся общей (copy-on-write).
+Воркеры перезапускаются после max_requests запросов со случайным
+разбросом, чтобы не уходить на перезапуск одновременно.
+"""
+import gc
+import multiprocessing
+import os
+
+# До загрузки приложения: объекты мастера не должны перемещаться
+# и освобождаться сборщиком, иначе страницы перестанут быть общими.
+gc.disable()
+
+CPU_COUNT = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8050')
+preload_app = True
+workers = int(os.getenv('GUNICORN_WORKERS', CPU_COUNT + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    """Прогрев мастер-процесса и заморозка объектов перед форком."""
+    from api.warmup import warm_up
+
+    warm_up()
+    gc.freeze()
+    server.log.info('Прогрев завершён, заморожено объектов: %s',
+                    gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    """Сборщик мусора в воркере работает только с новыми объектами."""
+    gc.enable()
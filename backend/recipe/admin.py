@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 
+from .admin_utils import PaginatedRelatedFilter, ScalableAdmin
 from .models import (Favourite,
                      Follow,
                      Ingredient,
@@ -18,6 +19,7 @@ class IngredientsInline(admin.StackedInline):
 
     model = RecipeIngredient
     extra = 2
+    autocomplete_fields = ('ingredients',)
 
     def get_formset(self, request, obj, **kwargs):
         """Метод для настройки formset."""
@@ -48,53 +50,66 @@ class IngredientsInline(admin.StackedInline):
         return IngredientsValidate
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     """Админ-зона подписок."""
 
     list_display = ('user', 'author')
-    list_filter = ('author',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'author')
+    list_filter = (('author', PaginatedRelatedFilter),)
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ScalableAdmin):
     """Админ-зона избранных рецептов."""
 
     list_display = ('author', 'recipe')
-    list_filter = ('author',)
-    search_fields = ('author',)
+    list_select_related = ('author', 'recipe')
+    list_filter = (('author', PaginatedRelatedFilter),)
+    search_fields = ('author__username', 'recipe__name')
+    autocomplete_fields = ('author', 'recipe')
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ScalableAdmin):
     """Админ-зона покупок."""
 
     list_display = ('author', 'recipe')
-    list_filter = ('author',)
-    search_fields = ('author',)
+    list_select_related = ('author', 'recipe')
+    list_filter = (('author', PaginatedRelatedFilter),)
+    search_fields = ('author__username', 'recipe__name')
+    autocomplete_fields = ('author', 'recipe')
 
 
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(ScalableAdmin):
     """Админ-зона ингридентов для рецептов."""
 
     list_display = ('id', 'recipe', 'ingredients', 'amount',)
-    list_filter = ('recipe', 'ingredients')
-    search_fields = ('name',)
+    list_select_related = ('recipe', 'ingredients')
+    list_filter = (('recipe', PaginatedRelatedFilter),
+                   ('ingredients', PaginatedRelatedFilter))
+    search_fields = ('recipe__name', 'ingredients__name')
+    autocomplete_fields = ('recipe', 'ingredients')
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableAdmin):
     """Админ-зона рецептов.
 
     Добавлен просмотр кол-ва добавленных рецептов в избранное.
     """
 
     list_display = ('id', 'author', 'name', 'pub_date', 'in_favorite_count')
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username')
-    list_filter = ('pub_date', 'author', 'tags')
-    filter_horizontal = ('ingredients', 'tags')
+    list_filter = ('pub_date',
+                   ('author', PaginatedRelatedFilter),
+                   ('tags', PaginatedRelatedFilter))
+    autocomplete_fields = ('author', 'tags')
     inlines = [IngredientsInline]
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def in_favorite_count(self, obj):
         """Число добавленных в избранное рецепта."""
-        return obj.favourite.all().count()
+        return obj.favorites_count
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -105,11 +120,11 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableAdmin):
     """Админ-зона ингридиентов."""
 
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name',)
 
 
@@ -0,0 +1,126 @@
+"""Общие части админ-зоны для больших таблиц."""
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .constants import ADMIN_ESTIMATED_COUNT_THRESHOLD, ADMIN_FILTER_PAGE_SIZE
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без COUNT(*) по всей таблице.
+
+    Для списка без фильтров на PostgreSQL число строк берётся
+    из статистики pg_class, если таблица больше порога. Отфильтрованные
+    списки считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        """Число объектов, для больших таблиц - оценка."""
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class '
+                        'WHERE oid = %s::regclass',
+                        (connection.ops.quote_name(
+                            queryset.model._meta.db_table),))
+                    row = cursor.fetchone()
+                if row and row[0] > ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                    return row[0]
+        return super().count
+
+
+class PaginatedRelatedFilter(admin.RelatedFieldListFilter):
+    """Фильтр по связанному объекту со списком вариантов по страницам.
+
+    В боковую панель загружается страница из ADMIN_FILTER_PAGE_SIZE
+    объектов и выбранный объект, а не вся связанная таблица.
+    """
+
+    page_size = ADMIN_FILTER_PAGE_SIZE
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        """Номер страницы вариантов из параметра <поле>__page."""
+        self.page_kwarg = f'{field_path}__page'
+        page = params.get(self.page_kwarg, '')
+        self.page = int(page) if page.isdigit() else 0
+        self.has_next = False
+        super().__init__(field, request, params, model, model_admin,
+                         field_path)
+
+    def expected_parameters(self):
+        """Параметры фильтра вместе с номером страницы."""
+        return [*super().expected_parameters(), self.page_kwarg]
+
+    def queryset(self, request, queryset):
+        """Фильтрация без параметра страницы."""
+        lookups = {name: value for name, value in self.used_parameters.items()
+                   if name != self.page_kwarg}
+        try:
+            return queryset.filter(**lookups)
+        except (ValueError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+
+    def field_choices(self, field, request, model_admin):
+        """Страница вариантов и выбранный объект."""
+        ordering = (self.field_admin_ordering(field, request, model_admin)
+                    or ('pk',))
+        related = field.remote_field.model._default_manager.order_by(
+            *ordering)
+        start = self.page * self.page_size
+        objects = list(related[start:start + self.page_size + 1])
+        self.has_next = len(objects) > self.page_size
+        target = field.target_field.attname
+        choices = [(getattr(obj, target), str(obj))
+                   for obj in objects[:self.page_size]]
+        if self.lookup_val and self.lookup_val not in {
+                str(value) for value, _ in choices}:
+            try:
+                selected = related.filter(
+                    **{target: self.lookup_val}).first()
+            except (ValueError, ValidationError):
+                selected = None
+            if selected is not None:
+                choices.insert(0, (getattr(selected, target), str(selected)))
+        return choices
+
+    def has_output(self):
+        """Фильтр виден, если есть варианты или другие страницы."""
+        return super().has_output() or self.page > 0
+
+    def choices(self, changelist):
+        """Варианты и ссылки на соседние страницы."""
+        yield from super().choices(changelist)
+        if self.page:
+            yield {
+                'selected': False,
+                'query_string': changelist.get_query_string(
+                    {self.page_kwarg: self.page - 1}),
+                'display': '← Предыдущие',
+            }
+        if self.has_next:
+            yield {
+                'selected': False,
+                'query_string': changelist.get_query_string(
+                    {self.page_kwarg: self.page + 1}),
+                'display': 'Следующие →',
+            }
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Админ-зона для больших таблиц.
+
+    Без точного общего числа строк и с оценкой числа строк
+    для списка без фильтров.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -2,3 +2,5 @@ MAX_LENGTH = 256
 MIN_VALUE = 1
 SLUG_LENGTH = 50
 SHORT_CODE_LENGTH = 6
+ADMIN_FILTER_PAGE_SIZE = 20
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
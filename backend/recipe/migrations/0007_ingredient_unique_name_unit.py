@@ -0,0 +1,46 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:47
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сливает дубликаты ингредиентов перед добавлением ограничения."""
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    duplicates = (Ingredient.objects
+                  .values('name', 'measurement_unit')
+                  .annotate(keep_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for group in duplicates:
+        extra_ids = list(Ingredient.objects
+                         .filter(name=group['name'],
+                                 measurement_unit=group['measurement_unit'])
+                         .exclude(id=group['keep_id'])
+                         .values_list('id', flat=True))
+        rows = RecipeIngredient.objects.filter(ingredients_id__in=extra_ids)
+        for row in rows.order_by('id'):
+            if RecipeIngredient.objects.filter(
+                    recipe_id=row.recipe_id,
+                    ingredients_id=group['keep_id']).exists():
+                row.delete()
+                continue
+            row.ingredients_id = group['keep_id']
+            row.save(update_fields=('ingredients',))
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_alter_ingredient_measurement_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:53
+
+from django.db import migrations
+
+
+def reset_short_codes(apps, schema_editor):
+    """Сбрасывает случайные коды: новые строятся из pk при запросе."""
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Recipe.objects.exclude(short_code=None).update(short_code=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_short_codes, migrations.RunPython.noop),
+    ]
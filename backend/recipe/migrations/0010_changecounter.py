@@ -0,0 +1,26 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256, unique=True, verbose_name='Набор данных')),
+                ('value', models.PositiveBigIntegerField(default=0, verbose_name='Номер изменения')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Счётчик изменений',
+                'verbose_name_plural': 'Счётчики изменений',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    """Подзапрос числа строк model, ссылающихся на объект."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счётчики по существующим данным."""
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Favourite = apps.get_model('recipe', 'Favourite')
+    User = apps.get_model('user', 'CustomUser')
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favourite, 'recipe'))
+    User.objects.update(recipes_count=count_subquery(Recipe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0011_image_variants'),
+        ('user', '0004_customuser_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    'ALTER TABLE recipe_recipe ADD COLUMN search_vector tsvector',
+    "UPDATE recipe_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(("
+    "SELECT string_agg(recipe_ingredient.name, ' ') "
+    "FROM recipe_recipeingredient JOIN recipe_ingredient "
+    "ON recipe_ingredient.id = recipe_recipeingredient.ingredients_id "
+    "WHERE recipe_recipeingredient.recipe_id = recipe_recipe.id), '')), "
+    "'B') || setweight(to_tsvector('russian', text), 'C')",
+    'CREATE INDEX recipe_search_vector_idx ON recipe_recipe '
+    'USING gin (search_vector)',
+)
+POSTGRES_BACKWARD = (
+    'ALTER TABLE recipe_recipe DROP COLUMN search_vector',
+)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipe_search USING fts5('
+    "name, ingredients, text, tokenize='unicode61 remove_diacritics 2')",
+    'INSERT INTO recipe_search (rowid, name, ingredients, text) '
+    "SELECT id, name, coalesce(("
+    "SELECT group_concat(recipe_ingredient.name, ' ') "
+    "FROM recipe_recipeingredient JOIN recipe_ingredient "
+    "ON recipe_ingredient.id = recipe_recipeingredient.ingredients_id "
+    "WHERE recipe_recipeingredient.recipe_id = recipe_recipe.id), ''), "
+    'text FROM recipe_recipe',
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE recipe_search',
+)
+STATEMENTS = {
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def run(direction):
+    """Выполняет SQL поискового индекса для текущей СУБД."""
+    def operation(apps, schema_editor):
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        for sql in statements[direction] if statements else ():
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+    """Поисковый индекс рецептов вне модели: tsvector или FTS5."""
+
+    dependencies = [
+        ('recipe', '0012_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(0), run(1)),
+    ]
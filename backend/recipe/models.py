@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import F, Q
+from django.db.models import (Exists, F, OuterRef, Prefetch, Q, Value,
+                              Window)
+from django.db.models.functions import RowNumber
 
 from .constants import MAX_LENGTH, MIN_VALUE, SHORT_CODE_LENGTH, SLUG_LENGTH
 
@@ -24,6 +26,12 @@ class Ingredient(models.Model):
 
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit'
+            ),
+        )
 
     def __str__(self):
         """Описание ингредиента."""
@@ -54,6 +62,85 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов с оптимизированным режимом чтения."""
+
+    def with_related(self, user=None):
+        """Подгружает теги, ингредиенты и авторов пачками.
+
+        Число запросов не зависит от количества рецептов в выборке.
+        """
+        authors = User.objects.all()
+        if user is not None and user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        else:
+            authors = authors.annotate(is_subscribed=Value(False))
+        return self.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredients')
+            ),
+            Prefetch('author', queryset=authors),
+        )
+
+    def with_user_flags(self, user=None):
+        """Аннотирует флаги избранного и списка покупок пользователя."""
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                author=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                author=user, recipe=OuterRef('pk'))),
+        )
+
+    def for_read(self, user=None):
+        """Полный режим чтения: связанные объекты и флаги пользователя."""
+        return self.with_related(user).with_user_flags(user)
+
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Подзапрос по подпискам вместо списка id: выборка остаётся одним
+        запросом при любом числе подписок.
+        """
+        return self.filter(author_id__in=Follow.objects.filter(
+            user=user).values('author_id'))
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние рецепты каждого автора одним запросом.
+
+        Не больше limit рецептов на автора: ROW_NUMBER() OVER
+        (PARTITION BY author_id) во вложенном запросе.
+        """
+        author_ids = list(author_ids)
+        if not author_ids:
+            # Пустой IN не компилируется в SQL (EmptyResultSet).
+            return self.none()
+        recipes = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return recipes.order_by('author_id', '-pub_date', '-id')
+        ranked = recipes.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        )).values('id', 'name', 'image', 'image_variants', 'cooking_time',
+                  'author_id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY author_id, row_number',
+            (*params, limit)
+        )
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -80,6 +167,11 @@ class Recipe(models.Model):
         upload_to='recipes/images/'
     )
 
+    image_variants = models.JSONField(
+        verbose_name='Варианты изображения',
+        default=dict, blank=True, editable=False
+    )
+
     text = models.TextField(
         verbose_name='Текст рецепта'
     )
@@ -104,12 +196,26 @@ class Recipe(models.Model):
                                   blank=True,
                                   null=True)
 
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном', default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         """Класс Мета."""
 
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=('-favorites_count', '-pub_date', '-id'),
+                         name='recipe_popularity_idx'),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=('name', 'author'),
@@ -254,3 +360,63 @@ class Follow(models.Model):
     def __str__(self):
         """Описание подписок."""
         return f'Пользователь {self.user} подписан на {self.author}'
+
+
+class ChangeCounter(models.Model):
+    """Счётчик изменений набора данных для условных запросов."""
+
+    name = models.CharField(
+        verbose_name='Набор данных', max_length=MAX_LENGTH, unique=True
+    )
+
+    value = models.PositiveBigIntegerField(
+        verbose_name='Номер изменения', default=0
+    )
+
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения', auto_now=True
+    )
+
+    class Meta:
+        """Класс Мета."""
+
+        verbose_name = 'Счётчик изменений'
+        verbose_name_plural = 'Счётчики изменений'
+
+    def __str__(self):
+        """Описание счётчика."""
+        return f'{self.name}: {self.value}'
+
+
+class ImageJob(models.Model):
+    """Задача фоновой обработки изображения объекта."""
+
+    model = models.CharField(verbose_name='Модель', max_length=MAX_LENGTH)
+
+    object_id = models.PositiveBigIntegerField(verbose_name='ID объекта')
+
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попытки', default=0
+    )
+
+    error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания', auto_now_add=True
+    )
+
+    class Meta:
+        """Класс Мета."""
+
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('model', 'object_id'),
+                name='unique_image_job'
+            ),
+        )
+
+    def __str__(self):
+        """Описание задачи."""
+        return f'{self.model} #{self.object_id}'
@@ -1,16 +1,17 @@
 from django.contrib import admin
 
+from recipe.admin_utils import ScalableAdmin
 from .models import CustomUser
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScalableAdmin):
     """Админ-зона пользователя."""
 
     list_display = ('id', 'username', 'first_name',
                     'last_name', 'email', 'role', 'is_staff')
     list_editable = ('role', 'is_staff')
     search_fields = ('username', 'email')
-    list_filter = ('username', 'email',)
+    list_filter = ('role', 'is_staff', 'is_active')
     empty_value_display = '-пусто-'
 
 
@@ -28,6 +28,13 @@ class CustomUser(AbstractUser):
         default=None,
         upload_to='user/images/'
     )
+    avatar_variants = models.JSONField(
+        verbose_name='Варианты аватара',
+        default=dict, blank=True, editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов', default=0, editable=False
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password', 'first_name', 'last_name']
 
@@ -41,3 +48,30 @@ class CustomUser(AbstractUser):
     def __str__(self):
         """Описание пользователя."""
         return self.username
+
+
+class RevokedToken(models.Model):
+    """Отозванные подписанные токены.
+
+    Пустой jti отзывает все токены пользователя, выданные до revoked_at.
+    Запись нужна только до истечения срока действия токенов.
+    """
+
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name='Пользователь',
+        related_name='revoked_tokens',
+        on_delete=models.CASCADE)
+    jti = models.CharField('Id токена', max_length=MAX_LENGTH, blank=True)
+    revoked_at = models.DateTimeField('Отозван', auto_now_add=True)
+    expires_at = models.DateTimeField('Истекает', db_index=True)
+
+    class Meta:
+        """Класс Мета."""
+
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+
+    def __str__(self):
+        """Описание отзыва."""
+        return f'{self.user_id}: {self.jti or "все токены"}'
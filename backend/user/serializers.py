@@ -3,8 +3,9 @@ from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from api.images import ImageVariantsField
+from api.relations import get_relations
 from .constants import MAX_LENGTH
-from recipe.models import Follow
 from .models import CustomUser
 
 
@@ -12,6 +13,7 @@ class UserReadSerializer(serializers.ModelSerializer):
     """Класс Сеализатор Пользователей."""
 
     avatar = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -20,7 +22,7 @@ class UserReadSerializer(serializers.ModelSerializer):
         model = CustomUser
         fields = (
             'id', 'email', 'first_name', 'last_name',
-            'username', 'avatar', 'is_subscribed'
+            'username', 'avatar', 'avatar_variants', 'is_subscribed'
         )
         extra_kwargs = {
             'is_subscribed': {'read_only': True}
@@ -34,10 +36,10 @@ class UserReadSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод на проверку подписки."""
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        return obj.pk in get_relations(request).following
 
 
 class UserSerializer(serializers.ModelSerializer):
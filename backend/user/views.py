@@ -1,14 +1,26 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import user_logged_in, user_logged_out
+from django.db.models import Value
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
+from djoser import views as djoser_views
 from djoser.serializers import SetPasswordSerializer
 from django.shortcuts import get_object_or_404
+from rest_framework_simplejwt.tokens import AccessToken
 
+from api.authentication import (SIGNED,
+                                issue_token,
+                                load_user,
+                                revocation_list)
+from api.constants import USER_THROTTLE_COSTS
 from api.pagination import CustomPagination
 from api.permissions import IsCurrentUserOrAdminOrReadOnly
 from api.serializers import FollowSerializer
-from recipe.models import Follow
+from recipe.models import Follow, Recipe
 from .models import CustomUser
 from .serializers import (UserSerializer,
                           UserAvatarSerializer,
@@ -21,6 +33,7 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     permission_classes = (IsCurrentUserOrAdminOrReadOnly, )
     pagination_class = CustomPagination
+    throttle_costs = USER_THROTTLE_COSTS
 
     def get_serializer_class(self):
         """Метод установки класс сеализатора."""
@@ -33,7 +46,7 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated])
     def me(self, request):
         """Кастомное получение профиля пользователя."""
-        user = self.request.user
+        user = load_user(self.request.user)
         serializer = UserReadSerializer(user, context={'request': request})
         return Response(serializer.data)
 
@@ -80,7 +93,9 @@ class UserViewSet(viewsets.ModelViewSet):
                 serializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
 
-        user.avatar.delete()
+        # Файл может быть общим с другими пользователями, его удалит
+        # gc_media.
+        user.avatar = None
         user.save()
         return Response({"detail": "Аватар удален."},
                         status=status.HTTP_204_NO_CONTENT)
@@ -114,9 +129,52 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated, ])
     def subscriptions(self, request):
         """Отображает все подписки пользователя."""
-        follows = Follow.objects.filter(user=self.request.user)
+        follows = (Follow.objects
+                   .filter(user=self.request.user)
+                   .select_related('author')
+                   .annotate(is_subscribed=Value(True))
+                   .order_by('id'))
         pages = self.paginate_queryset(follows)
-        serializer = FollowSerializer(pages,
-                                      many=True,
-                                      context={'request': request})
+        limit = request.query_params.get('recipes_limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        recipes_by_author = defaultdict(list)
+        for recipe in Recipe.objects.latest_by_author(
+                [follow.author_id for follow in pages], limit):
+            recipes_by_author[recipe.author_id].append(recipe)
+        serializer = FollowSerializer(
+            pages,
+            many=True,
+            context={'request': request,
+                     'recipes_by_author': recipes_by_author})
         return self.get_paginated_response(serializer.data)
+
+
+class TokenCreateView(djoser_views.TokenCreateView):
+    """Вход по email и паролю.
+
+    В режиме signed вместо токена из таблицы выдаётся подписанный токен
+    в том же формате ответа.
+    """
+
+    def _action(self, serializer):
+        """Выдача токена."""
+        if settings.AUTH_TOKEN_MODE != SIGNED:
+            return super()._action(serializer)
+        user = serializer.user
+        user_logged_in.send(sender=user.__class__, request=self.request,
+                            user=user)
+        return Response({'auth_token': issue_token(user)},
+                        status=status.HTTP_200_OK)
+
+
+class TokenDestroyView(djoser_views.TokenDestroyView):
+    """Выход: подписанный токен отзывается, токен из таблицы удаляется."""
+
+    def post(self, request):
+        """Выход пользователя."""
+        if not isinstance(request.auth, AccessToken):
+            return super().post(request)
+        revocation_list.revoke_token(request.auth)
+        user_logged_out.send(sender=request.user.__class__, request=request,
+                             user=request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)